@@ -0,0 +1,126 @@
+"""Dataset audit against a throttling stub chat model: the old one-at-a-time loop vs. the async auditor.
+
+The stub answers FAIL when the generated answer mentions a "fee" and PASS
+otherwise, takes 300ms per call, allows 40 req/s and 16 in flight, and fails
+3% of calls with a 500. Also checks that a re-audit after regenerating 10% of
+the pairs, and a resume after a crash, only judge pairs without a verdict, and
+that exact duplicate pairs cost one call between them.
+"""
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from langchain_openai import ChatOpenAI
+
+from stubs import chat_server, load_stage
+
+PAIRS = 300
+SHORT = 20
+DUPLICATES = 30
+CONCURRENCY = 16
+
+
+def make_pair(n, version=0):
+    answer = f"You must pay the fee for case {n}." if n % 5 == 0 else f"Yes, case {n} may apply online (v{version})."
+    context = "short" if n < SHORT else f"Context {n}: applicants for a residence permit must document income. " * 5
+    return {"question": f"Can I apply online in case {n}?", "ground_truth": answer, "context_used": context}
+
+
+def reply(prompt):
+    return "FAIL" if "fee" in prompt.split("Generated Answer:")[-1] else "PASS"
+
+
+def sequential_baseline(llm, data):
+    # The previous audit_dataset() loop: one blocking invoke per pair, errors dropped
+    kept = 0
+    for item in data:
+        if len(item["context_used"]) < 200:
+            continue
+        try:
+            if "PASS" in llm.invoke(f"Generated Answer: {item['ground_truth']}").content.upper():
+                kept += 1
+        except Exception:
+            pass
+    return kept
+
+
+def verdict_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for _ in f)
+
+
+def run(auditor, base_url, root, data):
+    # A fresh client per run, like separate processes: its async connections belong to one event loop
+    llm = ChatOpenAI(api_key="sk-test", base_url=base_url, max_retries=0)
+    with open(os.path.join(root, "dataset.json"), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = auditor.audit_dataset(
+            input_file=os.path.join(root, "dataset.json"), output_file=os.path.join(root, "clean.json"),
+            verdicts_file=os.path.join(root, "verdicts.jsonl"), concurrency=CONCURRENCY, llm=llm,
+        )
+    return stats, time.perf_counter() - start
+
+
+def main():
+    auditor = load_stage("4_audit_dataset")
+    server, base_url = chat_server(latency=0.3, rate=40, max_concurrent=16, error_rate=0.03, reply=reply)
+    data = [make_pair(n) for n in range(PAIRS)]
+    judged = PAIRS - SHORT
+
+    start = time.perf_counter()
+    sequential_baseline(ChatOpenAI(api_key="sk-test", base_url=base_url, max_retries=2), data)
+    sequential_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as root:
+        requests = server.requests
+        cold, cold_time = run(auditor, base_url, root, data)
+        assert cold["kept"] + cold["deleted_hallucination"] == judged and cold["errors"] == 0, cold
+
+        # Regenerate every tenth pair: only those reach the model again
+        regenerated = [make_pair(n, version=1) if n % 10 == 1 else make_pair(n) for n in range(PAIRS)]
+        changed = sum(1 for n in range(SHORT, PAIRS) if n % 10 == 1)
+        path = os.path.join(root, "verdicts.jsonl")
+        before = verdict_lines(path)
+        rerun, rerun_time = run(auditor, base_url, root, regenerated)
+        rerun_calls = verdict_lines(path) - before
+        assert rerun["cached"] == judged - changed and rerun_calls == changed, (rerun, rerun_calls)
+
+        # Crash half-way: keep half the verdict lines plus a torn one, then resume
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(lines[:judged // 2])
+            f.write(lines[judged // 2][:30])
+        resumed, _ = run(auditor, base_url, root, data)
+        assert resumed["cached"] == judged // 2 and resumed["kept"] == cold["kept"], resumed
+        total_requests = server.requests - requests
+
+        # Exact copies of judged pairs, audited from scratch: one verdict per distinct pair
+        dupes_root = os.path.join(root, "duplicates")
+        os.makedirs(dupes_root)
+        with_copies = data + [dict(item) for item in data[SHORT:SHORT + DUPLICATES]]
+        deduped, _ = run(auditor, base_url, dupes_root, with_copies)
+        deduped_calls = verdict_lines(os.path.join(dupes_root, "verdicts.jsonl"))
+        assert deduped["duplicates"] == DUPLICATES and deduped_calls == judged, (deduped, deduped_calls)
+        assert deduped["kept"] + deduped["deleted_hallucination"] == judged + DUPLICATES, deduped
+
+    server.shutdown()
+    print("=" * 30)
+    print(f" {PAIRS} pairs ({SHORT} rejected without a call); stub: 300ms/call, 40 req/s, 16 in flight, 3% 500s")
+    print(f" Sequential loop: {judged / sequential_time:>6.1f} pairs/s ({sequential_time:.1f}s)")
+    print(f" Async, {CONCURRENCY} at once: {judged / cold_time:>6.1f} pairs/s ({cold_time:.1f}s), "
+          f"{cold['retries']} retries ({cold['rate_limited']} rate limited), 0 pairs lost")
+    print(f" After regenerating {changed} pairs: {rerun_calls} judged, {rerun['cached']} from cache, {rerun_time:.2f}s")
+    print(f" Resume after a crash: {judged - resumed['cached']} judged, {resumed['cached']} from the checkpoint")
+    print(f" Requests sent by the async runs: {total_requests}")
+    print(f" With {DUPLICATES} exact copies added: {deduped_calls} verdicts for {judged + DUPLICATES} pairs")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Cleaning stage: serial full-text langdetect vs. sampled detection in a process pool + MinHash dedup.
+
+The corpus mixes distinct English pages, Norwegian pages, empty pages and
+near-copies of English pages (same text, different boilerplate and a changed
+sentence) to check that exactly the planted duplicates are dropped.
+"""
+import os
+import random
+import tempfile
+import time
+
+from langdetect import DetectorFactory, LangDetectException, detect
+
+from stubs import load_stage, page_url
+from corpus_store import CorpusStore
+
+ENGLISH = 600
+NORWEGIAN = 100
+EMPTY = 20
+DUPLICATES = 120
+
+EN_WORDS = ("applicants residence permit must document income housing family immigration skilled worker "
+            "students apply police appointment passport fee deadline decision appeal citizenship "
+            "employer contract salary requirement application online portal renew").split()
+NO_WORDS = ("søkere oppholdstillatelse må dokumentere inntekt bolig familieinnvandring faglært arbeidstaker "
+            "studenter søke politiet timeavtale pass gebyr frist vedtak klage statsborgerskap "
+            "arbeidsgiver kontrakt lønn krav søknad").split()
+
+
+def page(rng, words, sentences=80):
+    return " ".join(
+        " ".join(rng.choice(words) for _ in range(rng.randint(8, 16))).capitalize() + "."
+        for _ in range(sentences)
+    )
+
+
+def write_corpus(path, rng):
+    store = CorpusStore(path)
+    english = []
+
+    def save(text):
+        store.put(page_url(len(store)), text)
+
+    for _ in range(ENGLISH):
+        english.append(page(rng, EN_WORDS))
+        save(english[-1])
+    for _ in range(NORWEGIAN):
+        save(page(rng, NO_WORDS))
+    for _ in range(EMPTY):
+        save("")
+    for i in range(DUPLICATES):
+        # Same article behind another URL: extra boilerplate and one edited sentence
+        sentences = english[i].split(". ")
+        sentences[rng.randrange(len(sentences))] = "This sentence was edited on the mirror page"
+        save("Skip to main content. Print this page. " + ". ".join(sentences) + " Was this page helpful?")
+    store.close()
+
+
+def serial_baseline(path):
+    # The previous clean_files(): langdetect over the full text of every page, one after another
+    DetectorFactory.seed = 0
+    dropped = 0
+    for record in CorpusStore(path).iter_records():
+        content = record["text"].strip()
+        try:
+            if not content or detect(content) != "en":
+                dropped += 1
+        except LangDetectException:
+            dropped += 1
+    return dropped
+
+
+def main():
+    clean_data = load_stage("clean_data")
+    rng = random.Random(3)
+
+    with tempfile.TemporaryDirectory() as root:
+        corpus = os.path.join(root, "corpus.jsonl.gz")
+        write_corpus(corpus, rng)
+
+        start = time.perf_counter()
+        serial_dropped = serial_baseline(corpus)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        counts = clean_data.clean_files(corpus, report_file=os.path.join(root, "report.jsonl"), dry_run=True)
+        pool_time = time.perf_counter() - start
+
+    assert counts["near_duplicate"] == DUPLICATES, counts
+    assert counts["language"] == NORWEGIAN and counts["empty"] == EMPTY, counts
+
+    total = ENGLISH + NORWEGIAN + EMPTY + DUPLICATES
+    print("=" * 30)
+    print(f" {total} pages ({os.cpu_count()} CPUs)")
+    print(f" Serial full-text langdetect: {serial_time:.2f}s, {serial_dropped} dropped, duplicates kept")
+    print(f" Pool + sampled langdetect + MinHash: {pool_time:.2f}s ({serial_time / pool_time:.1f}x), "
+          f"{counts['language']} non-English, {counts['empty'] + counts['junk']} empty/junk, "
+          f"{counts['near_duplicate']} near-duplicates dropped")
+    print(f" Pages left to embed: {counts['kept']} instead of {total - serial_dropped}")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
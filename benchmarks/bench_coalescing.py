@@ -0,0 +1,102 @@
+"""Single-flight: N identical concurrent questions (half streaming) must cost one backend run.
+
+Also checks that cancelling the leader's task fails its followers instead of
+leaving them waiting.
+"""
+import asyncio
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stubs import api_server, load_api_with_stubs, ollama_server
+
+CONCURRENT = 40
+QUESTION = "Can I bring my family to Norway on a skilled worker permit?"
+
+
+def ask(base_url, n):
+    # Vary case/whitespace: coalescing keys on the normalised question
+    question = QUESTION.upper() if n % 3 == 0 else f"  {QUESTION} "
+    body = {"model": "llama3", "messages": [{"role": "user", "content": question}], "stream": n % 2 == 0}
+    with requests.post(f"{base_url}/v1/chat/completions", json=body, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        if body["stream"]:
+            text = "".join(line for line in response.iter_lines(decode_unicode=True) if "content" in line)
+        else:
+            text = response.json()["choices"][0]["message"]["content"]
+        return text, response.headers.get("X-Coalesced") == "1"
+
+
+def cancelled_leader():
+    from concurrency import FlightCancelled, SingleFlight
+
+    closed = []
+
+    async def producer():
+        try:
+            for n in range(100):
+                await asyncio.sleep(0.01)
+                yield f"token{n} "
+        finally:
+            closed.append(True)
+
+    async def follow(flight, streaming):
+        try:
+            if streaming:
+                async for _ in flight.subscribe():
+                    pass
+            else:
+                await flight.result()
+        except FlightCancelled:
+            return "cancelled"
+        return "finished"
+
+    async def scenario():
+        flights = SingleFlight()
+        flight = flights.start("key", producer())
+        followers = [asyncio.create_task(follow(flight, streaming)) for streaming in (True, False)]
+        await asyncio.sleep(0.05)
+        (leader,) = flights.tasks
+        leader.cancel()
+        outcomes = await asyncio.wait_for(asyncio.gather(*followers), timeout=5)
+        return outcomes, flights.get("key")
+
+    outcomes, left = asyncio.run(scenario())
+    assert outcomes == ["cancelled", "cancelled"] and left is None and closed
+    return outcomes
+
+
+def main():
+    cancelled = cancelled_leader()
+    ollama, ollama_url = ollama_server(tokens=30, token_delay=0.02)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        main_api, embeddings = load_api_with_stubs(workdir, ollama_url)
+        server, base_url = api_server(main_api.app)
+        # Snapshot after startup: the warmup already ran one embedding and one generation
+        embed_calls, generations = embeddings.calls, ollama.calls
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=CONCURRENT) as pool:
+            results = list(pool.map(lambda n: ask(base_url, n), range(CONCURRENT)))
+        elapsed = time.perf_counter() - start
+        server.should_exit = True
+
+    ollama.shutdown()
+    followers = sum(1 for _, coalesced in results if coalesced)
+    assert all("token29" in text for text, _ in results), "every caller must get the full answer"
+    assert ollama.calls - generations == 1, f"expected one generation, got {ollama.calls - generations}"
+    assert embeddings.calls - embed_calls == 1, "expected one query embedding"
+
+    print("=" * 30)
+    print(f" {CONCURRENT} identical requests in {elapsed:.2f}s")
+    print(f" Ollama generations: {ollama.calls - generations}, query embeddings: {embeddings.calls - embed_calls}")
+    print(f" Coalesced followers: {followers}, the rest were answer-cache hits or the leader")
+    print(f" Leader cancelled mid-generation: followers ended with {cancelled}")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
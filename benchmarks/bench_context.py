@@ -0,0 +1,84 @@
+"""Context assembly: prompt tokens before/after merging and de-duplication, with and without a token budget.
+
+Retrieval results are simulated the way they look on the real site: top-6 hits
+where neighbouring chunks of one page come back together (sharing the 200
+character splitter overlap) and some pages exist twice under different URLs.
+"""
+import random
+import statistics
+import time
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import stubs  # noqa: F401  (puts src/ on sys.path)
+
+PAGES = 200
+QUERIES = 500
+K = 6
+# Compared against the default (no budget): how much unique text a cap cuts
+BUDGET = 1200
+
+
+def page_text(n, rng):
+    sentences = [
+        f"Section {s} of guide {n}: applicants for a residence permit must document income, housing "
+        f"and {rng.choice(['a valid passport', 'a signed contract', 'proof of enrolment', 'a police certificate'])}."
+        for s in range(60)
+    ]
+    return " ".join(sentences)
+
+
+def main():
+    from context_assembly import assemble_context
+
+    rng = random.Random(7)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+    chunks_by_page = []
+    for n in range(PAGES):
+        text = page_text(n, rng)
+        chunks_by_page.append(splitter.create_documents([text], metadatas=[{"source": f"page-{n}"}]))
+
+    retrievals = []
+    for _ in range(QUERIES):
+        docs = []
+        while len(docs) < K:
+            page = rng.randrange(PAGES)
+            chunks = chunks_by_page[page]
+            first = rng.randrange(len(chunks) - 1)
+            roll = rng.random()
+            if roll < 0.5:
+                # Two neighbouring chunks of the same page
+                docs.extend(chunks[first:first + 2])
+            elif roll < 0.7:
+                # The same text published under a second URL (no start_index on the copy)
+                copy = chunks[first].model_copy(update={"metadata": {"source": f"mirror-{page}"}})
+                docs.extend([chunks[first], copy])
+            else:
+                docs.append(chunks[first])
+        retrievals.append(docs[:K])
+
+    print("=" * 30)
+    print(f" {QUERIES} simulated top-{K} retrievals")
+    for budget in (0, BUDGET):
+        before, after, elapsed, stats = [], [], [], []
+        for docs in retrievals:
+            start = time.perf_counter()
+            _, result = assemble_context(docs, token_budget=budget)
+            elapsed.append(time.perf_counter() - start)
+            before.append(result["retrieved_tokens"])
+            after.append(result["context_tokens"])
+            stats.append(result)
+
+        cut = sum(1 for s in stats if s["truncated"]) / len(stats)
+        print(f" Budget {budget or 'none (default)'}:")
+        print(f"   Context tokens: {statistics.mean(before):.0f} -> {statistics.mean(after):.0f} "
+              f"({100 * (1 - sum(after) / sum(before)):.1f}% smaller prompts)")
+        print(f"   Per request: {statistics.mean(s['merged_chunks'] for s in stats):.2f} merges, "
+              f"{statistics.mean(s['duplicates_dropped'] for s in stats):.2f} duplicates dropped, "
+              f"unique text cut on {cut:.0%} of requests")
+        print(f"   Assembly cost: {statistics.median(elapsed) * 1e6:.0f}us median")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Corpus storage: one .txt file per page vs. the compressed append-only store.
+
+Measures write time, a full sequential read (what clean/ingest do), random
+lookups by URL (what a re-crawl or an eval does) and the bytes on disk.
+"""
+import os
+import random
+import tempfile
+import time
+
+from stubs import page_url
+from corpus_store import CorpusStore
+
+PAGES = 5000
+PARAGRAPHS = 30
+LOOKUPS = 2000
+
+
+def page_text(n):
+    return " ".join(
+        f"Page {n} paragraph {p}: applicants for a residence permit must document income and housing."
+        for p in range(PARAGRAPHS)
+    )
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def files_run(directory, order):
+    # The previous layout: Source header + text, one file per page
+    os.makedirs(directory)
+    path = lambda n: os.path.join(directory, f"doc_{n:06d}.txt")
+
+    def write():
+        for n in range(PAGES):
+            with open(path(n), "w", encoding="utf-8") as f:
+                f.write(f"Source: {page_url(n)}\n\n{page_text(n)}")
+
+    def stream():
+        total = 0
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                total += len(f.read())
+        return total
+
+    def lookup():
+        for n in order:
+            with open(path(n), "r", encoding="utf-8") as f:
+                f.read()
+
+    _, write_time = timed(write)
+    _, stream_time = timed(stream)
+    _, lookup_time = timed(lookup)
+    size = sum(entry.stat().st_size for entry in os.scandir(directory))
+    return write_time, stream_time, lookup_time, size, PAGES
+
+
+def store_run(path, order):
+    def write():
+        with CorpusStore(path) as store:
+            for n in range(PAGES):
+                store.put(page_url(n), page_text(n))
+
+    def stream():
+        return sum(len(record["text"]) for record in CorpusStore(path).iter_records())
+
+    def lookup():
+        with CorpusStore(path) as store:
+            for n in order:
+                store.get_url(page_url(n))
+
+    _, write_time = timed(write)
+    _, stream_time = timed(stream)
+    _, lookup_time = timed(lookup)
+    size = os.path.getsize(path) + os.path.getsize(path + ".idx")
+    return write_time, stream_time, lookup_time, size, 2
+
+
+def main():
+    order = [random.Random(5).randrange(PAGES) for _ in range(LOOKUPS)]
+    with tempfile.TemporaryDirectory() as root:
+        rows = [
+            ("file per page", files_run(os.path.join(root, "scraped_text"), order)),
+            ("corpus store", store_run(os.path.join(root, "corpus.jsonl.gz"), order)),
+        ]
+
+    print("=" * 30)
+    print(f" {PAGES} pages, {LOOKUPS} random lookups")
+    print(f" {'layout':<14} {'write':>7} {'stream':>7} {'lookups':>8} {'on disk':>9} {'files':>6}")
+    for name, (write_time, stream_time, lookup_time, size, files) in rows:
+        print(f" {name:<14} {write_time:>6.2f}s {stream_time:>6.2f}s {lookup_time:>7.2f}s "
+              f"{size / 1e6:>7.1f}MB {files:>6}")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
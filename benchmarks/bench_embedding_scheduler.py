@@ -0,0 +1,143 @@
+"""Embedding throughput against a throttling provider: sequential batches vs. the adaptive scheduler.
+
+Also interrupts a scheduled run half-way and checks that the rerun only sends
+the batches that never completed (finished ones come back from the cache), and
+that a batch the provider rejects (400) does not throttle the others.
+"""
+import os
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+from langchain_openai import OpenAIEmbeddings
+
+from stubs import embedding_server
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_scheduler import BATCH_SIZE, ParallelEmbeddings
+
+TEXTS = 10_000
+LATENCY = 0.1
+RATE = 20
+MAX_CONCURRENT = 6
+ERROR_RATE = 0.02
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CrashAfter:
+    """Lets `batches` requests through, then fails every call like a killed process would."""
+
+    def __init__(self, embeddings, batches):
+        self.embeddings = embeddings
+        self.remaining = batches
+        self.model = embeddings.model
+
+    def embed_documents(self, texts):
+        if self.remaining <= 0:
+            raise Interrupted()
+        self.remaining -= 1
+        return self.embeddings.embed_documents(texts)
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+class RejectsOneBatch:
+    """Fails the batch containing "bad" with a 400, the way an over-long input would."""
+
+    model = "reject-one"
+
+    def embed_documents(self, texts):
+        if "bad" in texts:
+            raise BadRequest()
+        return [[0.0] for _ in texts]
+
+
+def rejected_batch():
+    scheduler = ParallelEmbeddings(RejectsOneBatch(), batch_size=1, initial_concurrency=4)
+    limit = scheduler.limiter.limit
+    try:
+        scheduler.embed_documents(["ok", "bad", "ok"])
+    except BadRequest:
+        pass
+    else:
+        raise AssertionError("a 400 must surface, not be retried away")
+    stats = scheduler.stats()
+    assert scheduler.limiter.limit > limit and stats["retries"] == 0, "a 400 must not halve the limit"
+    return stats
+
+
+def client(base_url, max_retries):
+    # No tiktoken pre-splitting: it would fetch an encoding from the network
+    return OpenAIEmbeddings(api_key="sk-test", base_url=base_url, chunk_size=BATCH_SIZE, max_retries=max_retries,
+                            check_embedding_ctx_length=False)
+
+
+def timed_run(server, embeddings, texts):
+    requests, limited, errors = server.requests, server.rate_limited, server.errors
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == len(texts)
+    return {
+        "seconds": elapsed,
+        "chunks_per_sec": len(texts) / elapsed,
+        "requests": server.requests - requests,
+        "rate_limited": server.rate_limited - limited,
+        "errors": server.errors - errors,
+    }
+
+
+def main():
+    rejected = rejected_batch()
+    texts = [f"Chunk {n}: applicants for a residence permit must document income and housing." for n in range(TEXTS)]
+
+    # Sequential: the previous OpenAIEmbeddings(chunk_size=100) with the client's own retries
+    server, base_url = embedding_server(LATENCY, RATE, MAX_CONCURRENT, ERROR_RATE)
+    sequential = timed_run(server, client(base_url, max_retries=6), texts)
+    server.shutdown()
+
+    with tempfile.TemporaryDirectory() as root:
+        server, base_url = embedding_server(LATENCY, RATE, MAX_CONCURRENT, ERROR_RATE)
+        cache = EmbeddingCache(os.path.join(root, "cold.sqlite"))
+        scheduler = ParallelEmbeddings(CachedEmbeddings(client(base_url, max_retries=0), cache))
+        scheduled = timed_run(server, scheduler, texts)
+        scheduler_stats = scheduler.stats()
+
+        # Crash half-way, then resume against the same cache
+        cache = EmbeddingCache(os.path.join(root, "resume.sqlite"))
+        total_batches = TEXTS // BATCH_SIZE
+        crashing = ParallelEmbeddings(CachedEmbeddings(CrashAfter(client(base_url, max_retries=0), total_batches // 2), cache))
+        try:
+            crashing.embed_documents(texts)
+        except Interrupted:
+            pass
+        # Batches already past the crash point still land in the cache; count them too
+        crashing.pool.shutdown(wait=True)
+        completed = crashing.stats()["batches"]
+        resumed = timed_run(server, ParallelEmbeddings(CachedEmbeddings(client(base_url, max_retries=0), cache)), texts)
+        server.shutdown()
+
+    assert resumed["requests"] - resumed["rate_limited"] - resumed["errors"] == total_batches - completed, \
+        "the resumed run must only embed batches that did not finish"
+
+    print("=" * 30)
+    print(f" {TEXTS} chunks in batches of {BATCH_SIZE}; provider: {LATENCY * 1000:.0f}ms/request, {RATE} req/s, "
+          f"{MAX_CONCURRENT} concurrent, {ERROR_RATE:.0%} 500s")
+    print(f" {'mode':<11} {'chunks/s':>9} {'time':>7} {'requests':>9} {'429s':>6} {'500s':>6}")
+    for name, r in (("sequential", sequential), ("scheduled", scheduled), ("resumed", resumed)):
+        print(f" {name:<11} {r['chunks_per_sec']:>9.0f} {r['seconds']:>6.1f}s {r['requests']:>9} "
+              f"{r['rate_limited']:>6} {r['errors']:>6}")
+    print(f" Scheduler settled at concurrency {scheduler_stats['concurrency_limit']} "
+          f"(peak {scheduler_stats['peak_concurrency']}), {scheduler_stats['retries']} retries")
+    print(f" Interrupted after {completed}/{total_batches} batches; the rerun embedded only the rest")
+    print(f" One batch rejected with 400: limit {rejected['concurrency_limit']}, {rejected['retries']} retries")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""HTML extraction: per-parser cost and agreement, and a full offline re-extraction from the raw archive.
+
+Pages imitate udi.no: a large header/nav/footer around a main-content div with
+headings, lists, links, tables and Norwegian characters; every tenth one is
+served as XHTML with an XML declaration. Backends that are not installed are
+skipped.
+"""
+import os
+import socket
+import tempfile
+import time
+
+from stubs import page_url
+from corpus_store import CorpusStore
+from extract import PARSERS, available_parsers, extract_corpus, extract_text
+
+PAGES = 2000
+SAMPLE = 300
+
+
+def udi_page(n):
+    menu = "".join(f"<li><a href='/en/section-{i}/'>Section {i}</a></li>" for i in range(60))
+    rows = "".join(f"<tr><td>Fee {i}</td><td>NOK {i * 100}</td></tr>" for i in range(8))
+    sections = "".join(
+        f"<h2>Rule {s}</h2><p>Søkere må dokumentere <a href='/en/x/'>inntekt</a> og bolig, page {n}. "
+        f"Applicants must <strong>document</strong> income and housing before applying.</p>"
+        f"<ul><li>Passport</li><li>Photo</li><li>Contract of employment</li></ul>"
+        for s in range(20)
+    )
+    declaration = "<?xml version='1.0' encoding='utf-8'?>\n" if n % 10 == 0 else ""
+    return (
+        f"{declaration}<!DOCTYPE html><html lang='en'><head><meta charset='utf-8'><title>UDI</title>"
+        "<script>window.dataLayer = [];</script><style>.nav { color: red }</style></head><body>"
+        f"<header><nav><ul>{menu}</ul></nav></header>"
+        f"<div class='layout main-content'><h1>Page {n}</h1>{sections}<table>{rows}</table>"
+        "<form><input name='q'></form><aside>Related pages</aside></div>"
+        f"<footer><ul>{menu}</ul></footer><noscript>Enable JS</noscript></body></html>"
+    )
+
+
+def no_network():
+    # Re-extraction must not touch the network; any connect in this process fails loudly
+    def refuse(*args, **kwargs):
+        raise AssertionError("network call during extraction")
+    socket.socket.connect = refuse
+
+
+def main():
+    pages = [udi_page(n) for n in range(PAGES)]
+    parsers = available_parsers()
+    reference = [extract_text(html, "html.parser") for html in pages[:SAMPLE]]
+
+    per_page = {}
+    for parser in parsers:
+        start = time.perf_counter()
+        texts = [extract_text(html, parser) for html in pages[:SAMPLE]]
+        elapsed = time.perf_counter() - start
+        same = sum(text == expected for text, expected in zip(texts, reference))
+        per_page[parser] = (elapsed / SAMPLE * 1000, same)
+
+    assert all(same == SAMPLE for _, same in per_page.values()), per_page
+    no_network()
+    runs = {}
+    with tempfile.TemporaryDirectory() as root:
+        raw_path = os.path.join(root, "raw_html.jsonl.gz")
+        with CorpusStore(raw_path) as raw:
+            for n, html in enumerate(pages):
+                raw.put(page_url(n), html)
+        raw_mb = os.path.getsize(raw_path) / 1e6
+
+        for parser in parsers:
+            corpus_path = os.path.join(root, f"corpus-{parser}.jsonl.gz")
+            start = time.perf_counter()
+            first = extract_corpus(raw_path, corpus_path, parser=parser)
+            elapsed = time.perf_counter() - start
+            again = extract_corpus(raw_path, corpus_path, parser=parser)
+            assert first["changed"] == PAGES and again["unchanged"] == PAGES, (first, again)
+            runs[parser] = elapsed
+
+    print("=" * 30)
+    print(f" {PAGES} pages ({len(pages[0]) // 1024} KB HTML each), archive {raw_mb:.1f} MB, {os.cpu_count()} CPUs")
+    print(f" {'parser':<12} {'ms/page':>8} {'same text':>10} {'full re-extract':>16}")
+    for parser in PARSERS:
+        if parser not in per_page:
+            print(f" {parser:<12} {'not installed':>8}")
+            continue
+        ms, same = per_page[parser]
+        print(f" {parser:<12} {ms:>8.2f} {same:>6}/{SAMPLE} {runs[parser]:>15.2f}s")
+    print(" A second re-extraction with the same rules rewrote 0 pages; no network calls were made.")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Dataset generation for a 1,000-question set: the old pipeline vs. reservoir sampling + abatch.
+
+The old pipeline re-split every page of the corpus to pick chunks, then asked the
+model about one chunk at a time. The stub chat model answers each prompt with 3
+Q&A pairs after 300ms and allows 40 req/s, 16 in flight.
+"""
+import json
+import os
+import random
+import tempfile
+import time
+
+from langchain_core.documents import Document
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from stubs import chat_server, load_stage, page_url
+
+PAGES = 3000
+CHUNKS = 334
+CONCURRENCY = 16
+
+
+def reply(prompt):
+    pairs = [{"question": f"Can I apply if I am case {n}?", "answer": "Yes, if the income rule is met."} for n in range(3)]
+    return json.dumps({"qa_pairs": pairs})
+
+
+def page_text(n):
+    return " ".join(f"Page {n} paragraph {p}: applicants for a residence permit must document income." for p in range(40))
+
+
+def old_pipeline(llm, rng):
+    # Every page loaded and re-split, then one blocking call per sampled chunk
+    documents = [Document(page_content=page_text(n), metadata={"source": page_url(n)}) for n in range(PAGES)]
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(documents)
+    selected = rng.sample(chunks, CHUNKS)
+    sampled = time.perf_counter()
+
+    parser = JsonOutputParser()
+    chain = ChatPromptTemplate.from_template("Context:\n{context}") | llm | parser
+    questions = 0
+    for chunk in selected:
+        try:
+            questions += len(chain.invoke({"context": chunk.page_content})["qa_pairs"])
+        except Exception:
+            pass
+    return questions, sampled
+
+
+def write_chunk_log(path):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    with open(path, "w", encoding="utf-8") as f:
+        for n in range(PAGES):
+            for i, content in enumerate(splitter.split_text(page_text(n))):
+                f.write(json.dumps({"chunk_id": f"{n}-{i}", "source": page_url(n), "content": content}) + "\n")
+
+
+def main():
+    generator = load_stage("4_generate_dataset")
+    server, base_url = chat_server(latency=0.3, rate=40, max_concurrent=16, reply=reply)
+
+    start = time.perf_counter()
+    old_questions, sampled = old_pipeline(ChatOpenAI(api_key="sk-test", base_url=base_url), random.Random(1))
+    old_time = time.perf_counter() - start
+    old_sampling = sampled - start
+
+    with tempfile.TemporaryDirectory() as root:
+        chunks_file = os.path.join(root, "all_chunks_debug.jsonl")
+        write_chunk_log(chunks_file)
+        log_mb = os.path.getsize(chunks_file) / 1e6
+
+        start = time.perf_counter()
+        selected, total = generator.sample_chunks(chunks_file, CHUNKS, random.Random(1))
+        new_sampling = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dataset = generator.generate_questions(
+            num_chunks=CHUNKS, concurrency=CONCURRENCY, seed=1, chunks_file=chunks_file,
+            output_file=os.path.join(root, "dataset.json"), llm=ChatOpenAI(api_key="sk-test", base_url=base_url),
+        )
+        new_time = time.perf_counter() - start
+    server.shutdown()
+
+    assert len(dataset) == old_questions == 3 * CHUNKS
+    assert all(item["source_chunk_id"] and item["source_url"] for item in dataset)
+
+    print("=" * 30)
+    print(f" {PAGES} pages, {total} chunks in the ingest log ({log_mb:.0f} MB), {CHUNKS} sampled -> {len(dataset)} questions")
+    print(f" Old: re-split corpus {old_sampling:.2f}s, one chunk at a time, total {old_time:.1f}s "
+          f"({old_questions / old_time:.1f} questions/s)")
+    print(f" New: reservoir sample {new_sampling:.2f}s, abatch x{CONCURRENCY}, total {new_time:.1f}s "
+          f"({len(dataset) / new_time:.1f} questions/s, {old_time / new_time:.1f}x)")
+    print(" Every question carries a real chunk id and URL")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Hybrid BM25 + vector retrieval on exact-term questions: recall, embedding calls, context size.
+
+Every page mentions one made-up form code; each query asks about one code and the
+page that contains it is the right answer. The fake embeddings carry no meaning,
+so the vector-only column is a floor, not a prediction of OpenAI recall.
+"""
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+from stubs import FakeEmbeddings, load_stage, page_url
+
+PAGES = 800
+QUERIES = 200
+VECTOR_K = 6
+HYBRID_K = 4
+
+
+def write_coded_corpus(path):
+    from corpus_store import CorpusStore
+
+    store = CorpusStore(path)
+    for n in range(PAGES):
+        filler = " ".join(
+            f"Paragraph {p}: applicants for a residence permit must document income and housing."
+            for p in range(15)
+        )
+        text = f"{filler} To apply, fill in form UDI-{n:04d} and book an appointment. {filler}"
+        store.put(page_url(n), text)
+    store.close()
+
+
+def run(retriever, embeddings, queries):
+    calls = embeddings.calls
+    latencies, hits, chars = [], 0, []
+    for n, query in queries:
+        start = time.perf_counter()
+        docs = retriever.invoke(query)
+        latencies.append(time.perf_counter() - start)
+        hits += any(f"UDI-{n:04d}" in doc.page_content for doc in docs)
+        chars.append(sum(len(doc.page_content) for doc in docs))
+    latencies.sort()
+    return {
+        "recall": hits / len(queries),
+        "embed_calls": embeddings.calls - calls,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "context_chars": statistics.mean(chars),
+    }
+
+
+def main():
+    ingest = load_stage("3_ingest")
+    from lexical_index import HybridRetriever, LexicalIndex
+    from vector_index import FlatIndex, FlatIndexRetriever
+
+    with tempfile.TemporaryDirectory() as root:
+        write_coded_corpus(os.path.join(root, "corpus.jsonl.gz"))
+        db_path = os.path.join(root, "chroma_db")
+        result = ingest.ingest_data(
+            corpus_path=os.path.join(root, "corpus.jsonl.gz"), db_path=db_path,
+            manifest_file=os.path.join(root, "manifest.json"), debug_file=os.path.join(root, "chunks.jsonl"),
+            embeddings=FakeEmbeddings(),
+        )
+
+        embeddings = FakeEmbeddings()
+        index = FlatIndex(os.path.join(db_path, ingest.FLAT_INDEX_DIR))
+        lexical = LexicalIndex(os.path.join(db_path, ingest.LEXICAL_INDEX_DIR))
+        vector = FlatIndexRetriever(index=index, embeddings=embeddings, k=VECTOR_K)
+        hybrid_vector = FlatIndexRetriever(index=index, embeddings=embeddings, k=20)
+
+        keyword = [(n, f"UDI-{n:04d}") for n in range(0, PAGES, PAGES // QUERIES)]
+        question = [(n, f"Where do I send form UDI-{n:04d} after signing it?") for n, _ in keyword]
+        rows = [
+            ("vector, keyword", run(vector, embeddings, keyword), VECTOR_K),
+            ("hybrid, keyword", run(HybridRetriever(lexical=lexical, vector_retriever=hybrid_vector, k=HYBRID_K),
+                                    embeddings, keyword), HYBRID_K),
+            ("vector, question", run(vector, embeddings, question), VECTOR_K),
+            ("hybrid, question", run(HybridRetriever(lexical=lexical, vector_retriever=hybrid_vector, k=HYBRID_K),
+                                     embeddings, question), HYBRID_K),
+        ]
+        # A code every page carries fills k with verbatim hits: no embedding. A short plain
+        # question never takes the fast path, and a rare code is topped up to k from the fusion
+        hybrid = HybridRetriever(lexical=lexical, vector_retriever=hybrid_vector, k=HYBRID_K)
+        calls = embeddings.calls
+        shared = hybrid.invoke("UDI")
+        shared_embeds = embeddings.calls - calls
+        short_question = hybrid.invoke("residence permit")
+        rare = hybrid.invoke("UDI-0042")
+        index_bytes = sum(
+            os.path.getsize(os.path.join(dirpath, name))
+            for dirpath, _, names in os.walk(os.path.join(db_path, ingest.LEXICAL_INDEX_DIR)) for name in names
+        )
+
+    hybrid_keyword = rows[1][1]
+    assert hybrid_keyword["recall"] == 1.0, "every code must be found lexically"
+    assert len(shared) == HYBRID_K and shared_embeds == 0, "k verbatim hits must not be embedded"
+    assert embeddings.calls - calls == 2, "short questions and rare codes go through the vector side"
+    assert len(short_question) == len(rare) == HYBRID_K and "UDI-0042" in rare[0].page_content
+
+    print("=" * 30)
+    print(f" {result['total']} chunks, {len(keyword)} queries per row, lexical index {index_bytes / 1e6:.1f} MB")
+    print(f" {'retriever':<17} {'k':>2} {'recall':>7} {'embeds':>7} {'p50':>8} {'context':>9}")
+    for name, r, k in rows:
+        print(f" {name:<17} {k:>2} {r['recall']:>7.2f} {r['embed_calls']:>7} {r['p50_ms']:>6.2f}ms "
+              f"{r['context_chars']:>7.0f}ch")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
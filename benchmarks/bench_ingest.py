@@ -0,0 +1,72 @@
+"""Incremental ingest: embedding calls and wall time for full, no-op and one-page-changed runs."""
+import os
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+from stubs import FakeEmbeddings, load_stage, page_url, write_corpus
+from corpus_store import CorpusStore
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+PAGES = 300
+
+
+def run(ingest, root, embeddings, full=False, db="chroma_db"):
+    start = time.perf_counter()
+    result = ingest.ingest_data(
+        full=full,
+        corpus_path=os.path.join(root, "corpus.jsonl.gz"),
+        db_path=os.path.join(root, db),
+        manifest_file=os.path.join(root, "ingest_manifest.json"),
+        debug_file=os.path.join(root, "all_chunks_debug.jsonl"),
+        embeddings=embeddings,
+    )
+    return result, time.perf_counter() - start
+
+
+def main():
+    ingest = load_stage("3_ingest")
+
+    with tempfile.TemporaryDirectory() as root:
+        corpus = os.path.join(root, "corpus.jsonl.gz")
+        write_corpus(corpus, PAGES)
+
+        first = FakeEmbeddings()
+        full, full_time = run(ingest, root, first)
+        assert first.texts_embedded == full["total"]
+
+        noop = FakeEmbeddings()
+        unchanged, noop_time = run(ingest, root, noop)
+        assert noop.calls == 0 and unchanged["added"] == 0 and unchanged["deleted"] == 0
+
+        with CorpusStore(corpus) as store:
+            page = store.get_url(page_url(7))
+            store.put(page["url"], page["text"] + " New rule: the income requirement changed on 1 January.")
+            store.delete(store.get_url(page_url(8))["id"])
+        changed = FakeEmbeddings()
+        delta, delta_time = run(ingest, root, changed)
+        assert changed.texts_embedded == delta["added"] and delta["added"] > 0 and delta["deleted"] > 0
+
+        # A rebuild into a fresh store still finds every vector in the embedding cache.
+        # (Separate store dirs: Chroma keeps its sqlite handle open for the whole process.)
+        cache = EmbeddingCache(os.path.join(root, "embedding_cache.sqlite"))
+        warm = FakeEmbeddings()
+        run(ingest, root, CachedEmbeddings(warm, cache, model_name="fake"), full=True, db="chroma_cold")
+        cold_calls = warm.texts_embedded
+        rebuilt = FakeEmbeddings()
+        cached = CachedEmbeddings(rebuilt, cache, model_name="fake")
+        _, rebuild_time = run(ingest, root, cached, full=True, db="chroma_warm")
+        assert rebuilt.calls == 0
+
+    print("=" * 30)
+    print(f" Full build:    {full['total']} chunks, {first.texts_embedded} embedded in {first.calls} calls, {full_time:.2f}s")
+    print(f" No changes:    {noop.calls} embedding calls, {noop_time:.2f}s")
+    print(f" 1 edit, 1 del: {changed.texts_embedded} embedded, {delta['deleted']} deleted, {delta_time:.2f}s")
+    print(f" Rebuild, cached: {rebuilt.calls} provider calls (cold run: {cold_calls} texts), "
+          f"{rebuild_time:.2f}s, cache totals over both runs {cached.stats()}")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Peak RSS of a full ingest as the corpus grows tenfold: streaming ingest vs. load-everything.
+
+Each run is a fresh subprocess so ru_maxrss is that run's own peak.
+- "load all" reproduces the previous pipeline's first half
+  (every page loaded + split_documents + one JSON blob), before any store writes.
+- "streaming" is the same scope for the new pipeline: every chunk is embedded,
+  but the vector store discards the writes.
+- "+ Chroma" is the real run; the difference is Chroma's own in-memory HNSW index.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+from stubs import FakeEmbeddings, load_stage, write_corpus
+from corpus_store import CorpusStore
+
+SIZES = (300, 3000)
+PARAGRAPHS = 100
+
+
+class NullStore:
+    def __init__(self, persist_directory, embedding_function):
+        self.embeddings = embedding_function
+
+    def add_documents(self, documents, ids):
+        self.embeddings.embed_documents([doc.page_content for doc in documents])
+
+    def delete(self, ids):
+        pass
+
+
+def streaming(root, store=True):
+    ingest = load_stage("3_ingest")
+    if not store:
+        ingest.Chroma = NullStore
+    return ingest.ingest_data(
+        corpus_path=os.path.join(root, "corpus.jsonl.gz"), db_path=os.path.join(root, "chroma_db"),
+        manifest_file=os.path.join(root, "manifest.json"), debug_file=os.path.join(root, "chunks.jsonl"),
+        embeddings=FakeEmbeddings(), flat_index="none",
+    )
+
+
+def load_all(root):
+    from langchain_core.documents import Document
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    documents = [
+        Document(page_content=record["text"], metadata={"source": record["url"]})
+        for record in CorpusStore(os.path.join(root, "corpus.jsonl.gz")).iter_records()
+    ]
+    chunks = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_documents(documents)
+    with open(os.path.join(root, "chunks.json"), "w", encoding="utf-8") as f:
+        json.dump([{"source": c.metadata["source"], "content": c.page_content} for c in chunks], f, indent=2)
+    return {"total": len(chunks)}
+
+
+def worker(mode, root):
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            if mode == "load all":
+                result = load_all(root)
+            else:
+                result = streaming(root, store=mode == "chroma")
+        finally:
+            sys.stdout = stdout
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"chunks": result["total"], "peak_mb": peak, "seconds": time.perf_counter() - start}))
+
+
+def measure(mode, root):
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", mode, root], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    rows = []
+    for pages in SIZES:
+        with tempfile.TemporaryDirectory() as root:
+            write_corpus(os.path.join(root, "corpus.jsonl.gz"), pages, paragraphs=PARAGRAPHS)
+            # Uncompressed page text, comparable with the old directory of .txt files
+            store = CorpusStore(os.path.join(root, "corpus.jsonl.gz"))
+            corpus_mb = sum(len(record["text"].encode("utf-8")) for record in store.iter_records()) / 1e6
+            rows.append((pages, corpus_mb, [measure(mode, root) for mode in ("load all", "streaming", "chroma")]))
+
+    print("=" * 30)
+    print(f" {'pages':>6} {'corpus':>8} {'chunks':>7} {'load all':>9} {'streaming':>10} {'+ Chroma':>9} {'time':>7}")
+    for pages, corpus_mb, (old, new, full) in rows:
+        print(f" {pages:>6} {corpus_mb:>6.1f}MB {new['chunks']:>7} {old['peak_mb']:>7.0f}MB {new['peak_mb']:>8.0f}MB "
+              f"{full['peak_mb']:>7.0f}MB {full['seconds']:>6.1f}s")
+    growth = [rows[-1][2][i]["peak_mb"] - rows[0][2][i]["peak_mb"] for i in range(3)]
+    print(f" Peak growth for {SIZES[-1] // SIZES[0]}x the corpus: load all +{growth[0]:.0f}MB, "
+          f"streaming +{growth[1]:.0f}MB, with Chroma +{growth[2]:.0f}MB")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        worker(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,197 @@
+"""Load test of /v1/chat/completions against a fake Ollama and FakeEmbeddings, swept over concurrency levels.
+
+Each level is a closed loop: `concurrency` clients send streaming requests back
+to back until the level's request count is used up. Every question is distinct,
+so the answer cache and request coalescing never short-circuit the full path.
+Per level the report records throughput, latency and TTFT percentiles, the
+error and rejection rates, and the median server-side stage timings from the
+debug payload. With --baseline, the run fails when a level's throughput, p95
+latency or error rate is worse than the baseline report by more than --tolerance.
+
+    python bench_load.py --levels 1,4,16 --report load_report.json
+    python bench_load.py --baseline load_report.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stubs import api_server, load_api_with_stubs, ollama_server
+from metrics import percentile
+
+LEVELS = "1,2,4,8,16,32"
+REQUESTS = 64
+PERCENTILES = (50, 95, 99)
+CLIENT_TIMEOUT = 60
+
+
+def distribution(values):
+    if not values:
+        return None
+    return {f"p{q}": round(percentile(values, q), 1) for q in PERCENTILES} | {"max": round(max(values), 1)}
+
+
+def ask(session, base_url, question, error_answer):
+    """One streaming request. Returns a result row; latencies are in ms."""
+    body = {"model": "llama3", "messages": [{"role": "user", "content": question}], "stream": True, "debug": True}
+    start = time.perf_counter()
+    row = {"status": None, "ttft_ms": None, "tokens": 0, "debug": {}}
+    try:
+        with session.post(f"{base_url}/v1/chat/completions", json=body, stream=True, timeout=CLIENT_TIMEOUT) as response:
+            row["status"] = response.status_code
+            if response.status_code != 200:
+                return row | {"latency_ms": (time.perf_counter() - start) * 1000}
+            text = []
+            for line in response.iter_lines(decode_unicode=True):
+                if not line.startswith("data: ") or line == "data: [DONE]":
+                    continue
+                chunk = json.loads(line[len("data: "):])
+                content = chunk["choices"][0]["delta"].get("content")
+                if content:
+                    if row["ttft_ms"] is None:
+                        row["ttft_ms"] = (time.perf_counter() - start) * 1000
+                    row["tokens"] += 1
+                    text.append(content)
+                row["debug"] = chunk.get("debug", row["debug"])
+            if "".join(text) == error_answer:
+                row["status"] = "error_answer"
+    except requests.RequestException as e:
+        row["status"] = type(e).__name__
+    return row | {"latency_ms": (time.perf_counter() - start) * 1000}
+
+
+def run_level(base_url, concurrency, total, error_answer):
+    counter = iter(range(total))
+
+    def client(worker):
+        rows = []
+        with requests.Session() as session:
+            for n in counter:
+                rows.append(ask(session, base_url, f"Load test level {concurrency} question {n}?", error_answer))
+        return rows
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        rows = [row for rows in pool.map(client, range(concurrency)) for row in rows]
+    elapsed = time.perf_counter() - start
+
+    ok = [row for row in rows if row["status"] == 200]
+    rejected = sum(1 for row in rows if row["status"] == 429)
+    errors = len(rows) - len(ok) - rejected
+    stages = {}
+    for row in ok:
+        for stage, ms in row["debug"].get("stages_ms", {}).items():
+            stages.setdefault(stage, []).append(ms)
+        if "queue_wait_ms" in row["debug"]:
+            stages.setdefault("queue_wait", []).append(row["debug"]["queue_wait_ms"])
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(rows),
+        "ok": len(ok),
+        "rejected": rejected,
+        "errors": errors,
+        "error_rate": round((errors + rejected) / len(rows), 4),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "tokens_per_s": round(sum(row["tokens"] for row in ok) / elapsed, 1),
+        "latency_ms": distribution([row["latency_ms"] for row in ok]),
+        "ttft_ms": distribution([row["ttft_ms"] for row in ok if row["ttft_ms"] is not None]),
+        "server_stages_p50_ms": {stage: round(percentile(values, 50), 1) for stage, values in sorted(stages.items())},
+    }
+
+
+def compare(report, baseline, tolerance):
+    """Regressions against a baseline report, as readable lines (empty when none)."""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in report["levels"]:
+        old = previous.get(level["concurrency"])
+        if not old or not old["ok"] or not level["ok"]:
+            continue
+        c = level["concurrency"]
+        if level["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"c={c}: throughput {level['throughput_rps']} req/s, baseline {old['throughput_rps']}")
+        if level["latency_ms"]["p95"] > old["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"c={c}: p95 latency {level['latency_ms']['p95']} ms, baseline {old['latency_ms']['p95']}")
+        if level["error_rate"] > old["error_rate"] + 0.01:
+            regressions.append(f"c={c}: error rate {level['error_rate']:.2%}, baseline {old['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat API against local stub backends.")
+    parser.add_argument("--levels", default=LEVELS, help=f"comma-separated client concurrency levels (default: {LEVELS})")
+    parser.add_argument("--requests", type=int, default=REQUESTS,
+                        help=f"requests per level, at least one per client (default: {REQUESTS})")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per fake generation (default: 40)")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="fake Ollama tokens/s per generation (default: 200)")
+    parser.add_argument("--prompt-delay", type=float, default=0.05, help="fake prompt processing time in s (default: 0.05)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="fake embedding call latency in s (default: 0.02)")
+    parser.add_argument("--ollama-parallel", type=int, default=4, help="fake OLLAMA_NUM_PARALLEL (default: 4)")
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="LLM_MAX_CONCURRENCY for the API (default: 4)")
+    parser.add_argument("--llm-queue", type=int, default=64, help="LLM_MAX_QUEUE for the API (default: 64)")
+    parser.add_argument("--report", default="load_report.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier report to compare against; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs. the baseline (default: 0.2)")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    report_path = os.path.abspath(args.report)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    os.environ["LLM_MAX_CONCURRENCY"] = str(args.llm_concurrency)
+    os.environ["LLM_MAX_QUEUE"] = str(args.llm_queue)
+    ollama, ollama_url = ollama_server(tokens=args.tokens, token_delay=1 / args.token_rate,
+                                       prompt_delay=args.prompt_delay, parallel=args.ollama_parallel)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("report", "baseline", "tolerance")}
+    config |= {"python": platform.python_version(), "cpus": os.cpu_count()}
+    report = {"created": int(time.time()), "config": config, "levels": []}
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            main_api, _ = load_api_with_stubs(workdir, ollama_url, embed_latency=args.embed_latency)
+            server, base_url = api_server(main_api.app)
+            print("=" * 30)
+            print(f" Fake Ollama: {args.tokens} tokens at {args.token_rate:.0f}/s, {args.ollama_parallel} slots; "
+                  f"API: {args.llm_concurrency} generations, queue {args.llm_queue}")
+            print(f" {'clients':>7} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'TTFT p50':>9} {'TTFT p95':>9} {'errors':>7}")
+            for concurrency in levels:
+                level = run_level(base_url, concurrency, max(args.requests, concurrency), main_api.ERROR_ANSWER)
+                report["levels"].append(level)
+                latency, ttft = level["latency_ms"] or {}, level["ttft_ms"] or {}
+                print(f" {concurrency:>7} {level['throughput_rps']:>7.1f} {latency.get('p50', 0):>5.0f}ms "
+                      f"{latency.get('p95', 0):>5.0f}ms {latency.get('p99', 0):>5.0f}ms {ttft.get('p50', 0):>7.0f}ms "
+                      f"{ttft.get('p95', 0):>7.0f}ms {level['error_rate']:>7.1%}")
+            server.should_exit = True
+        finally:
+            os.chdir(cwd)
+    ollama.shutdown()
+
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f" Report: {report_path}")
+
+    if baseline:
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f" REGRESSION {line}")
+        print(f" {len(regressions)} regressions vs. {args.baseline} (tolerance {args.tolerance:.0%})")
+        print("=" * 30)
+        sys.exit(1 if regressions else 0)
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Burst load against a single-slot fake Ollama: unbounded queueing vs. admission control with 429s."""
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stubs import api_server, load_api_with_stubs, ollama_server
+from metrics import percentile
+
+BURST = 60
+TOKENS = 10
+TOKEN_DELAY = 0.01
+CLIENT_TIMEOUT = 10
+
+
+def burst(base_url, label):
+    def one(n):
+        body = {"model": "llama3", "messages": [{"role": "user", "content": f"{label} question {n}?"}]}
+        start = time.perf_counter()
+        try:
+            response = requests.post(f"{base_url}/v1/chat/completions", json=body, timeout=CLIENT_TIMEOUT)
+            return response.status_code, time.perf_counter() - start, response.headers
+        except requests.Timeout:
+            return "timeout", time.perf_counter() - start, {}
+
+    with ThreadPoolExecutor(max_workers=BURST) as pool:
+        results = list(pool.map(one, range(BURST)))
+
+    ok = [latency for status, latency, _ in results if status == 200]
+    rejected = [headers for status, _, headers in results if status == 429]
+    timeouts = sum(1 for status, _, _ in results if status == "timeout")
+    retry = rejected[0].get("Retry-After") if rejected else "-"
+    print(f" {label:<10} ok {len(ok):>3}  429 {len(rejected):>3}  timeouts {timeouts:>3}  "
+          f"p50 {percentile(ok, 50):.2f}s  p99 {percentile(ok, 99):.2f}s  Retry-After {retry}")
+
+
+def main():
+    ollama, ollama_url = ollama_server(tokens=TOKENS, token_delay=TOKEN_DELAY, parallel=1)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["LLM_MAX_CONCURRENCY"] = "1"
+        os.environ["LLM_MAX_QUEUE"] = "8"
+        main_api, _ = load_api_with_stubs(workdir, ollama_url)
+        server, base_url = api_server(main_api.app)
+
+        print("=" * 30)
+        print(f" Burst of {BURST} requests, fake Ollama serves one {TOKENS * TOKEN_DELAY:.1f}s generation at a time")
+        bounded = main_api.llm_limiter
+        main_api.llm_limiter = main_api.AdmissionLimiter(max_in_flight=1, max_queue=10**6)
+        burst(base_url, "unbounded")
+        main_api.llm_limiter = bounded
+        burst(base_url, "bounded")
+        print("=" * 30)
+        server.should_exit = True
+
+    ollama.shutdown()
+
+
+if __name__ == "__main__":
+    main()
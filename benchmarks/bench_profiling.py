@@ -0,0 +1,132 @@
+"""Request profiling: the cost of the middleware when off, and what a profiled request produces.
+
+The disabled path is timed on its own around a no-op ASGI app, since its cost is
+far below the noise of a real request. The API then runs against the fake Ollama
+and FakeEmbeddings to check every trigger (X-Profile header, POST /admin/profile,
+sampling rate) and both output formats, and to time profiled vs. plain requests.
+"""
+import asyncio
+import glob
+import json
+import os
+import pstats
+import statistics
+import tempfile
+import time
+
+import requests
+
+from stubs import api_server, load_api_with_stubs, load_stage, ollama_server
+
+CALLS = 200_000
+RUNS = 20
+SAMPLED = 80
+TOKEN = "bench-profile-token"
+
+
+async def noop_app(scope, receive, send):
+    pass
+
+
+def middleware_cost():
+    profiling = load_stage("profiling")
+    scope = {"type": "http", "path": "/v1/chat/completions",
+             "headers": [(b"host", b"localhost"), (b"content-type", b"application/json"), (b"user-agent", b"bench")]}
+    middleware = profiling.ProfilingMiddleware(noop_app, profiling.RequestProfiler(sample_rate=0, token=""))
+
+    async def loop(app):
+        start = time.perf_counter()
+        for _ in range(CALLS):
+            await app(scope, None, None)
+        return (time.perf_counter() - start) / CALLS
+
+    bare = asyncio.run(loop(noop_app))
+    wrapped = asyncio.run(loop(middleware))
+    return (wrapped - bare) * 1e9
+
+
+def ask(base_url, question, stream=False, headers=None):
+    body = {"model": "llama3", "messages": [{"role": "user", "content": question}], "stream": stream}
+    start = time.perf_counter()
+    response = requests.post(f"{base_url}/v1/chat/completions", json=body, headers=headers or {})
+    response.raise_for_status()
+    return time.perf_counter() - start, response.headers.get("X-Request-ID")
+
+
+def settle(profiler):
+    # Profiles are written after the response has been sent
+    while profiler.busy or profiler.writing:
+        time.sleep(0.01)
+
+
+def main():
+    disabled_ns = middleware_cost()
+    ollama, ollama_url = ollama_server(tokens=20, token_delay=0.005)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            main_api, _ = load_api_with_stubs(workdir, ollama_url)
+            profiler = main_api.profiler
+            profiler.token, profiler.directory = TOKEN, os.path.join(workdir, "profiles")
+            server, base_url = api_server(main_api.app)
+
+            denied = requests.post(f"{base_url}/admin/profile", headers={"X-Profile-Token": "wrong"}).status_code
+            _, unprofiled_id = ask(base_url, "Plain question?", headers={"X-Profile": "wrong"})
+
+            # On demand with a caller-chosen id, then two armed requests (one streamed)
+            _, header_id = ask(base_url, "Header question?", headers={"X-Profile": TOKEN, "X-Request-ID": "req-header-1"})
+            requests.post(f"{base_url}/admin/profile?requests=2", headers={"X-Profile-Token": TOKEN}).raise_for_status()
+            _, armed_id = ask(base_url, "Armed question?")
+            _, streamed_id = ask(base_url, "Armed streaming question?", stream=True)
+
+            settle(profiler)
+            profiler.fmt = "pstats"
+            _, pstats_id = ask(base_url, "Pstats question?", headers={"X-Profile": TOKEN})
+            settle(profiler)
+            profiler.fmt = "speedscope"
+
+            plain = [ask(base_url, f"Timing question {n}?")[0] for n in range(RUNS)]
+            profiled = [ask(base_url, f"Profiled timing question {n}?", headers={"X-Profile": TOKEN})[0]
+                        for n in range(RUNS)]
+
+            settle(profiler)
+            written = profiler.written
+            profiler.sample_rate = 0.25
+            for n in range(SAMPLED):
+                ask(base_url, f"Sampled question {n}?")
+            settle(profiler)
+            sampled = profiler.written - written
+            profiler.sample_rate = 0
+
+            server.should_exit = True
+            files = sorted(glob.glob(os.path.join(profiler.directory, "*")))
+            with open(next(f for f in files if f.endswith("req-header-1.speedscope.json")), encoding="utf-8") as f:
+                speedscope = json.load(f)
+            with open(next(f for f in files if f.endswith("req-header-1.json")), encoding="utf-8") as f:
+                meta = json.load(f)
+            stats = pstats.Stats(next(f for f in files if f.endswith(f"{pstats_id}.pstats")))
+        finally:
+            os.chdir(cwd)
+    ollama.shutdown()
+
+    assert denied == 403 and unprofiled_id is None
+    assert header_id == "req-header-1" and armed_id and streamed_id and pstats_id
+    assert meta["request_id"] == "req-header-1" and {"retrieve", "generate", "request"} <= set(meta["stages_ms"])
+    assert speedscope["name"].startswith("req-header-1 ")
+    assert profiler.errors == 0
+
+    langchain_ms = sum(tt for (path, _, _), (_, _, tt, _, _) in stats.stats.items() if "langchain" in path) * 1000
+    print("=" * 30)
+    print(f" Disabled middleware: {disabled_ns:.0f} ns per chat request")
+    print(f" Plain request p50 {statistics.median(plain) * 1000:.1f} ms, "
+          f"profiled request p50 {statistics.median(profiled) * 1000:.1f} ms (sampling every 1 ms)")
+    print(f" Sampling rate 0.25: {sampled} of {SAMPLED} requests profiled")
+    print(f" Files per profile: <time>-<request id>.speedscope.json or .pstats, plus .json with the stages")
+    print(f" Speedscope name: {speedscope['name']}")
+    print(f" pstats profile: {len(stats.stats)} functions, {langchain_ms:.1f} ms of own time inside LangChain")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
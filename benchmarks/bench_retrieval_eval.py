@@ -0,0 +1,87 @@
+"""Retrieval-only evaluation: recall@k / MRR / nDCG in seconds, with no LLM in the loop.
+
+Builds the form-code corpus from bench_hybrid, turns a sample of the ingest chunk
+log into a dataset the way 4_generate_dataset.py does (real chunk ids and URLs),
+then scores vector and hybrid retrieval. A fake Ollama is running only to prove
+it is never called. The fake embeddings carry no meaning, so the vector rows are
+a floor, not a prediction of OpenAI recall.
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+from stubs import FakeEmbeddings, load_stage, ollama_server
+from bench_hybrid import write_coded_corpus
+
+QUESTIONS = 200
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def main():
+    import langchain_openai
+
+    server, base_url = ollama_server()
+    os.environ["OLLAMA_BASE_URL"] = base_url
+    langchain_openai.OpenAIEmbeddings = lambda **kwargs: FakeEmbeddings()
+
+    cwd = os.getcwd()
+    reports = {}
+    with tempfile.TemporaryDirectory() as root:
+        os.chdir(root)
+        try:
+            os.makedirs("data")
+            write_coded_corpus("data/corpus.jsonl.gz")
+            quiet(load_stage("3_ingest").ingest_data, embeddings=FakeEmbeddings())
+
+            with open("data/all_chunks_debug.jsonl", "r", encoding="utf-8") as f:
+                chunks = [json.loads(line) for line in f if "UDI-" in line]
+            dataset = []
+            for chunk in random.Random(2).sample(chunks, QUESTIONS):
+                code = re.search(r"UDI-\d{4}", chunk["content"]).group()
+                dataset.append({"question": f"Which appointment do I book after filling in form {code}?",
+                                "ground_truth": "-", "context_used": chunk["content"],
+                                "source_chunk_id": chunk["chunk_id"], "source_url": chunk["source"]})
+            # Half the dataset in the old format: sample index instead of a chunk id, no URL
+            for n, item in enumerate(dataset[::2]):
+                item["source_chunk_id"] = n
+                del item["source_url"]
+            with open("data/benchmark_dataset_clean.json", "w", encoding="utf-8") as f:
+                json.dump(dataset, f)
+
+            runner = load_stage("5_run_benchmark")
+            for mode in ("vector", "hybrid"):
+                runner.RETRIEVAL_MODE = mode
+                start = time.perf_counter()
+                reports[mode] = quiet(runner.run_retrieval_benchmark, k=10)
+                reports[mode]["seconds"] = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    server.shutdown()
+    assert server.calls == 0, "retrieval-only mode must not call the LLM"
+    assert all(report["questions"] == QUESTIONS for report in reports.values())
+
+    print("=" * 30)
+    print(f" {QUESTIONS} questions (half in the old dataset format), k=10, 0 LLM calls")
+    print(f" {'mode':<7} {'level':<6} {'R@1':>6} {'R@5':>6} {'R@10':>6} {'MRR':>6} {'nDCG@10':>8} {'time':>7}")
+    for mode, report in reports.items():
+        for level in ("chunk", "page"):
+            m = report[level]
+            print(f" {mode:<7} {level:<6} {m['recall@1']:>6.2f} {m['recall@5']:>6.2f} {m['recall@10']:>6.2f} "
+                  f"{m['mrr']:>6.2f} {m['ndcg@10']:>8.2f} {report['seconds']:>6.1f}s")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Evaluation runner: one question at a time vs. a worker pool, and resuming a crashed run.
+
+The fake Ollama allows 4 parallel generations (OLLAMA_NUM_PARALLEL=4) with a
+prompt delay and per-token latency, and answers "token0 token1 ..." so every
+grade is FAIL; only time and request counts matter here.
+"""
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+from stubs import FakeEmbeddings, load_stage, ollama_server, write_corpus
+
+QUESTIONS = 80
+PARALLEL = 4
+WORKERS = 8
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def main():
+    import langchain_openai
+
+    server, base_url = ollama_server(tokens=20, token_delay=0.01, prompt_delay=0.1, parallel=PARALLEL)
+    os.environ["OLLAMA_BASE_URL"] = base_url
+    langchain_openai.OpenAIEmbeddings = lambda **kwargs: FakeEmbeddings()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        os.chdir(root)
+        try:
+            os.makedirs("data")
+            write_corpus("data/corpus.jsonl.gz", 50)
+            quiet(load_stage("3_ingest").ingest_data, embeddings=FakeEmbeddings())
+            dataset = [{"question": f"Can I renew permit type {n} online?", "ground_truth": "Yes."}
+                       for n in range(QUESTIONS)]
+            with open("data/benchmark_dataset_clean.json", "w", encoding="utf-8") as f:
+                json.dump(dataset, f)
+
+            runner = load_stage("5_run_benchmark")
+            rows = {}
+            for workers in (1, WORKERS):
+                start = time.perf_counter()
+                report = quiet(runner.run_benchmark, workers=workers, fresh=True)
+                rows[workers] = (time.perf_counter() - start, report)
+
+            # Crash after half the questions: keep those lines plus a torn one, then resume
+            with open(runner.RESULTS_FILE, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+            with open(runner.RESULTS_FILE, "w", encoding="utf-8") as f:
+                f.writelines(lines[:QUESTIONS // 2])
+                f.write(lines[QUESTIONS // 2][:40])
+            calls = server.calls
+            resumed = quiet(runner.run_benchmark, workers=WORKERS)
+            resumed_calls = server.calls - calls
+        finally:
+            os.chdir(cwd)
+
+    server.shutdown()
+    assert resumed["questions"] == QUESTIONS and resumed["answered_this_run"] == QUESTIONS // 2
+    # One answer and one judge generation per remaining question
+    assert resumed_calls == 2 * (QUESTIONS - QUESTIONS // 2), resumed_calls
+
+    serial_time, serial = rows[1]
+    pool_time, pooled = rows[WORKERS]
+    print("=" * 30)
+    print(f" {QUESTIONS} questions, fake Ollama with {PARALLEL} parallel slots")
+    print(f" 1 worker:  {serial_time:.1f}s")
+    print(f" {WORKERS} workers: {pool_time:.1f}s ({serial_time / pool_time:.1f}x)")
+    for stage in ("retrieve", "generate", "judge", "total"):
+        stats = pooled["stages_ms"][stage]
+        print(f"   {stage:<9} p50 {stats['p50']:>6.0f}ms  p90 {stats['p90']:>6.0f}ms  p99 {stats['p99']:>6.0f}ms")
+    print(f" Resume after a crash at question {QUESTIONS // 2}: {resumed_calls} Ollama calls "
+          f"for the remaining {QUESTIONS - QUESTIONS // 2} questions, report covers all {resumed['questions']}")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Sitemap parsing: streaming iterparse with index recursion vs. loading with ET.fromstring."""
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import requests
+
+from stubs import QuietHandler, serve
+from fetch_sitemap import fetch_and_save_sitemap, fetch_one, is_safe, local_name, parse_priority, parse_sitemap
+
+CHILD_SITEMAPS = 8
+URLS_PER_SITEMAP = 20000
+NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+def make_urlset(base, prefix, count):
+    rows = "".join(
+        f"<url><loc>{base}/en/word-definitions/page-{prefix}-{n}/</loc>"
+        f"<lastmod>2026-0{1 + n % 9}-1{n % 10}T08:00:00+02:00</lastmod>"
+        f"<priority>0.{n % 10}</priority></url>"
+        for n in range(count)
+    )
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="{NS}">{rows}</urlset>'
+
+
+def sitemap_server():
+    documents = {}
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            self.send_body(documents[self.path], content_type="application/xml")
+
+    server, base_url = serve(Handler)
+    children = "".join(f"<sitemap><loc>{base_url}/sitemap-{k}.xml</loc></sitemap>" for k in range(CHILD_SITEMAPS))
+    documents["/sitemap.xml"] = f'<?xml version="1.0"?><sitemapindex xmlns="{NS}">{children}</sitemapindex>'
+    for k in range(CHILD_SITEMAPS):
+        documents[f"/sitemap-{k}.xml"] = make_urlset(base_url, k, URLS_PER_SITEMAP)
+    documents["/big.xml"] = make_urlset(base_url, "big", CHILD_SITEMAPS * URLS_PER_SITEMAP)
+    return server, base_url, documents
+
+
+def measure(fn):
+    # Timed on its own: tracemalloc hooks every allocation and would inflate the time
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def entries_fromstring(url):
+    # The old approach: whole document in memory, then the whole tree; same entries as parse_sitemap
+    entries = []
+    for elem in ET.fromstring(requests.get(url).content):
+        fields = {local_name(child.tag): (child.text or "").strip() for child in elem}
+        loc = fields.get("loc")
+        if loc and is_safe(loc):
+            entries.append({
+                "loc": loc,
+                "lastmod": fields.get("lastmod") or None,
+                "priority": parse_priority(fields.get("priority")),
+            })
+    return entries
+
+
+def main():
+    server, base_url, documents = sitemap_server()
+    big_mb = len(documents["/big.xml"]) / 2**20
+
+    with tempfile.TemporaryDirectory() as out:
+        output_file = os.path.join(out, "safe_urls.json")
+        start = time.perf_counter()
+        fetch_and_save_sitemap(f"{base_url}/sitemap.xml", output_file)
+        index_time = time.perf_counter() - start
+        with open(output_file, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    assert len(saved) == CHILD_SITEMAPS * URLS_PER_SITEMAP
+    assert all(entry["lastmod"] and entry["priority"] is not None for entry in saved)
+
+    # Both sides build the same entry list from one large document
+    old, old_time, old_peak = measure(lambda: entries_fromstring(f"{base_url}/big.xml"))
+    new, new_time, new_peak = measure(lambda: fetch_one(requests.Session(), f"{base_url}/big.xml")[0])
+    server.shutdown()
+    assert old == new
+    new_count = len(new)
+
+    # A malformed <priority> costs that field, not the sitemap
+    broken = make_urlset("https://example.org", "broken", 3).replace("<priority>0.1</priority>", "<priority>high</priority>")
+    entries, _ = parse_sitemap(io.BytesIO(broken.encode("utf-8")))
+    assert [entry["priority"] for entry in entries] == [0.0, None, 0.2]
+
+    print("=" * 30)
+    print(f" Index with {CHILD_SITEMAPS} children, {len(saved)} URLs: {index_time:.2f}s end to end")
+    print(f" Single {big_mb:.1f} MB sitemap ({new_count} URLs):")
+    print(f"   fromstring: {old_time:.2f}s, peak {old_peak:.1f} MB (incl. entry list)")
+    print(f"   iterparse:  {new_time:.2f}s, peak {new_peak:.1f} MB (incl. entry list)")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
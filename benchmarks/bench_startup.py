@@ -0,0 +1,106 @@
+"""Startup: import time, time to /healthz and /readyz, and the first request with and without warmup.
+
+Import time and the cost of building the pipeline are measured in a fresh
+interpreter, since this process already has LangChain loaded. The fake Ollama
+takes LOAD_DELAY extra on its first generation, like loading llama3 into
+memory; with warmup that cost moves from the first user to startup.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from stubs import SRC_DIR, api_server, load_api_with_stubs, ollama_server
+
+LOAD_DELAY = 2.0
+
+COLD_IMPORT = f"""
+import json, sys, time
+sys.path.insert(0, {SRC_DIR!r})
+start = time.perf_counter()
+import main_api
+imported = time.perf_counter()
+heavy = sorted(m for m in sys.modules if m.split(".")[0] in ("langchain", "langchain_core", "openai", "chromadb"))
+main_api.build_pipeline()
+print(json.dumps({{"import": imported - start, "build": time.perf_counter() - imported, "heavy": heavy}}))
+"""
+
+
+def cold_import(workdir):
+    # The real OpenAIEmbeddings is built but never called, so the fake key is enough
+    env = {**os.environ, "OPENAI_API_KEY": "sk-benchmark-not-used"}
+    out = subprocess.run([sys.executable, "-c", COLD_IMPORT], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def wait_for(url, status=200):
+    while True:
+        try:
+            if requests.get(url).status_code == status:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.01)
+
+
+def start(main_api, warmup):
+    # A fresh lifespan on the already imported module, as if the process had just started
+    main_api.WARMUP = warmup
+    main_api.pipeline = None
+    main_api.readiness.clear()
+    main_api.readiness["status"] = "starting"
+
+    started = time.perf_counter()
+    server, base_url = api_server(main_api.app, wait_ready=False)
+    wait_for(f"{base_url}/healthz")
+    healthy = time.perf_counter() - started
+    wait_for(f"{base_url}/readyz")
+    ready = time.perf_counter() - started
+
+    body = {"model": "llama3", "messages": [{"role": "user", "content": f"First question (warmup={warmup})?"}]}
+    asked = time.perf_counter()
+    requests.post(f"{base_url}/v1/chat/completions", json=body).raise_for_status()
+    first = time.perf_counter() - asked
+    server.should_exit = True
+    return {"healthz": healthy, "readyz": ready, "first_request": first, "readiness": dict(main_api.readiness)}
+
+
+def main():
+    ollama, ollama_url = ollama_server(tokens=20, token_delay=0.01, load_delay=LOAD_DELAY)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            main_api, _ = load_api_with_stubs(workdir, ollama_url)
+            costs = cold_import(workdir)
+            runs = {}
+            for warmup in (True, False):
+                ollama.loaded = False
+                runs[warmup] = start(main_api, warmup)
+        finally:
+            os.chdir(cwd)
+
+    ollama.shutdown()
+    warm, cold = runs[True], runs[False]
+    assert not costs["heavy"], f"import main_api loaded {costs['heavy'][:5]}"
+    assert warm["readiness"]["status"] == cold["readiness"]["status"] == "ready"
+    assert warm["first_request"] < LOAD_DELAY < cold["first_request"]
+
+    print("=" * 30)
+    print(f" import main_api: {costs['import'] * 1000:.0f} ms "
+          f"(building the pipeline, previously done on import: {costs['build'] * 1000:.0f} ms more)")
+    print(f" Fake Ollama needs {LOAD_DELAY:.1f}s to load the model on its first generation")
+    for name, run in (("warmup on", warm), ("warmup off", cold)):
+        print(f" {name:<10}  /healthz {run['healthz'] * 1000:>5.0f} ms  /readyz {run['readyz'] * 1000:>5.0f} ms  "
+              f"first request {run['first_request'] * 1000:>5.0f} ms")
+    print(f" Warmup stages (ms): {warm['readiness']['warmup_ms']}")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
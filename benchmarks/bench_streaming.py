@@ -0,0 +1,59 @@
+"""Time-to-first-token: blocking /v1/chat/completions vs. stream=true, against a fake Ollama."""
+import json
+import statistics
+import tempfile
+import time
+
+import requests
+
+from stubs import api_server, load_api_with_stubs, ollama_server
+
+TOKENS = 60
+TOKEN_DELAY = 0.03
+RUNS = 5
+
+
+def ask(base_url, question, stream):
+    body = {"model": "llama3", "messages": [{"role": "user", "content": question}], "stream": stream}
+    start = time.perf_counter()
+    ttft = None
+    with requests.post(f"{base_url}/v1/chat/completions", json=body, stream=stream) as response:
+        response.raise_for_status()
+        if not stream:
+            response.json()
+            return time.perf_counter() - start, time.perf_counter() - start
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        for line in response.iter_lines(decode_unicode=True):
+            if not line.startswith("data: ") or line == "data: [DONE]":
+                continue
+            delta = json.loads(line[len("data: "):])["choices"][0]["delta"]
+            if delta.get("content") and ttft is None:
+                ttft = time.perf_counter() - start
+    return ttft, time.perf_counter() - start
+
+
+def main():
+    ollama, ollama_url = ollama_server(tokens=TOKENS, token_delay=TOKEN_DELAY)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        main_api, _ = load_api_with_stubs(workdir, ollama_url)
+        server, base_url = api_server(main_api.app)
+
+        # Distinct questions so the answer cache never short-circuits a run
+        blocking = [ask(base_url, f"Blocking question {n}?", stream=False) for n in range(RUNS)]
+        streamed = [ask(base_url, f"Streaming question {n}?", stream=True) for n in range(RUNS)]
+        server.should_exit = True
+
+    ollama.shutdown()
+    print("=" * 30)
+    print(f" Fake Ollama: {TOKENS} tokens, {TOKEN_DELAY * 1000:.0f} ms/token; median of {RUNS} runs")
+    print(f" Blocking:  TTFT {statistics.median(t for t, _ in blocking) * 1000:.0f} ms "
+          f"(= total {statistics.median(t for _, t in blocking) * 1000:.0f} ms)")
+    print(f" Streaming: TTFT {statistics.median(t for t, _ in streamed) * 1000:.0f} ms, "
+          f"total {statistics.median(t for _, t in streamed) * 1000:.0f} ms")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    main()
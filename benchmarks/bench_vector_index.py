@@ -0,0 +1,134 @@
+"""Chroma vs. memory-mapped flat index: startup time, RSS per worker and query latency.
+
+Each backend is measured in a fresh subprocess, the way a uvicorn worker would load it.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+from stubs import FakeEmbeddings, load_stage, write_corpus
+
+PAGES = 1500
+DIM = 1536
+QUERIES = 200
+K = 6
+
+
+def memory_status():
+    status = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                status[key] = int(value.split()[0]) / 1024
+    return status
+
+
+def worker(backend, path):
+    embeddings = FakeEmbeddings(dim=DIM)
+    queries = [embeddings.embed_query(f"question {n}") for n in range(QUERIES)]
+    baseline = memory_status()
+
+    start = time.perf_counter()
+    if backend == "chroma":
+        from langchain_community.vectorstores import Chroma
+
+        db = Chroma(persist_directory=path, embedding_function=embeddings)
+        search = lambda vector: db.similarity_search_by_vector(vector, k=K)
+    else:
+        from vector_index import FlatIndex
+
+        index = FlatIndex(path)
+        search = lambda vector: index.documents(vector, K)
+    search(queries[0])
+    startup = time.perf_counter() - start
+
+    latencies = []
+    hits = []
+    for vector in queries:
+        start = time.perf_counter()
+        docs = search(vector)
+        latencies.append(time.perf_counter() - start)
+        hits.append([doc.metadata["chunk_id"] for doc in docs])
+
+    memory = memory_status()
+    print(json.dumps({
+        "startup_ms": startup * 1000,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": sorted(latencies)[int(0.99 * len(latencies))] * 1000,
+        "rss_mb": memory["VmRSS"] - baseline["VmRSS"],
+        "anon_mb": memory["RssAnon"] - baseline["RssAnon"],
+        "file_mb": memory["RssFile"] - baseline["RssFile"],
+        "hits": hits,
+    }))
+
+
+def exact_top_k(db):
+    import numpy as np
+
+    stored = db.get(include=["embeddings", "metadatas"])
+    matrix = np.asarray(stored["embeddings"], dtype=np.float32)
+    ids = [metadata["chunk_id"] for metadata in stored["metadatas"]]
+    embeddings = FakeEmbeddings(dim=DIM)
+    truth = []
+    for n in range(QUERIES):
+        scores = matrix @ np.asarray(embeddings.embed_query(f"question {n}"), dtype=np.float32)
+        truth.append([ids[i] for i in np.argsort(-scores)[:K]])
+    return truth
+
+
+def measure(backend, path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", backend, path],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    ingest = load_stage("3_ingest")
+    from vector_index import export_chroma
+    from langchain_community.vectorstores import Chroma
+
+    with tempfile.TemporaryDirectory() as root:
+        write_corpus(os.path.join(root, "corpus.jsonl.gz"), PAGES)
+        db_path = os.path.join(root, "chroma_db")
+        result = ingest.ingest_data(
+            corpus_path=os.path.join(root, "corpus.jsonl.gz"), db_path=db_path,
+            manifest_file=os.path.join(root, "manifest.json"), debug_file=os.path.join(root, "chunks.jsonl"),
+            embeddings=FakeEmbeddings(dim=DIM),
+        )
+        db = Chroma(persist_directory=db_path, embedding_function=FakeEmbeddings(dim=DIM))
+        int8_path = os.path.join(root, "flat_int8")
+        export_chroma(db, int8_path, quantize=True)
+        exact = exact_top_k(db)
+
+        rows = [
+            ("chroma", measure("chroma", db_path)),
+            ("flat float32", measure("flat", os.path.join(db_path, ingest.FLAT_INDEX_DIR))),
+            ("flat int8", measure("flat", int8_path)),
+        ]
+
+    print("=" * 30)
+    print(f" {result['total']} chunks x {DIM} dims, {QUERIES} queries, k={K}")
+    print(f" {'backend':<13} {'startup':>9} {'p50':>8} {'p99':>8} {'RSS':>8} {'private':>8} {'shared':>8} {'recall':>8}")
+    for name, r in rows:
+        recall = statistics.mean(len(set(a) & set(b)) / K for a, b in zip(exact, r["hits"]))
+        print(f" {name:<13} {r['startup_ms']:>7.0f}ms {r['p50_ms']:>6.2f}ms {r['p99_ms']:>6.2f}ms "
+              f"{r['rss_mb']:>6.1f}MB {r['anon_mb']:>6.1f}MB {r['file_mb']:>6.1f}MB {recall:>8.2f}")
+    print(" private = anonymous memory each worker pays; shared = page cache mapped by every worker")
+    print(" recall = top-k agreement with exact brute-force search (HNSW is approximate)")
+    print("=" * 30)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        worker(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,324 @@
+"""Local stand-ins for the services the pipeline talks to, so benchmarks run offline."""
+import importlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+def load_stage(name):
+    # Pipeline scripts start with a digit (e.g. "2_scrape_data"), so plain `import` can't reach them
+    return importlib.import_module(name)
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type="text/html; charset=utf-8", status=200, headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(handler_cls):
+    """Start `handler_cls` on a free localhost port in a daemon thread. Returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}"
+
+
+def fake_page(n, paragraphs=40):
+    body = "".join(
+        f"<p>Paragraph {p} of page {n}: residence permit rules for skilled workers and students.</p>"
+        for p in range(paragraphs)
+    )
+    return (
+        "<html><head><script>var x = 1;</script><style>p {}</style></head><body>"
+        "<header>UDI</header><nav><a href='/'>Home</a></nav>"
+        f"<div class='main-content'><h1>Page {n}</h1>{body}</div>"
+        "<footer>Contact</footer></body></html>"
+    )
+
+
+def page_server(latency=0.05, paragraphs=40):
+    """HTML pages at /page/<n>, each delayed by `latency` seconds. Honours If-None-Match."""
+
+    class Handler(QuietHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            n = self.path.rsplit("/", 1)[-1]
+            etag = f'"page-{n}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_body(fake_page(n, paragraphs), headers={"ETag": etag})
+
+    return serve(Handler)
+
+
+class FakeEmbeddings:
+    """Deterministic stand-in for OpenAIEmbeddings that counts every call it receives."""
+
+    def __init__(self, dim=64, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+        self.texts_embedded = 0
+        self.lock = threading.Lock()
+
+    def vector(self, text):
+        import hashlib
+        import random
+
+        # Unit length, like OpenAI embeddings, so L2 and cosine rankings agree
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.uniform(-1.0, 1.0) for _ in range(self.dim)]
+        norm = sum(x * x for x in vector) ** 0.5
+        return [x / norm for x in vector]
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.calls += 1
+            self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def write_corpus(path, pages, paragraphs=20):
+    """Synthetic corpus store with one record per page, as the scraper writes it."""
+    from corpus_store import CorpusStore
+
+    with CorpusStore(path) as store:
+        for n in range(pages):
+            text = " ".join(
+                f"Page {n} paragraph {p}: applicants for a residence permit must document income and housing."
+                for p in range(paragraphs)
+            )
+            store.put(page_url(n), text)
+
+
+def page_url(n):
+    return f"https://www.udi.no/en/page-{n}/"
+
+
+def ollama_server(tokens=40, token_delay=0.02, prompt_delay=0.0, parallel=None, load_delay=0.0):
+    """Fake Ollama: /api/chat and /api/generate stream `tokens` NDJSON chunks, `token_delay` apart.
+
+    `prompt_delay` models prompt processing before the first token, and
+    `parallel` caps simultaneous generations like OLLAMA_NUM_PARALLEL (extra
+    requests wait). `load_delay` is added to the first generation, like Ollama
+    loading the model into memory; set `server.loaded = False` to unload it
+    again. The returned server has a `calls` counter for checking how many
+    generations were run.
+    """
+
+    class Handler(QuietHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            with lock:
+                server.calls += 1
+                cold, server.loaded = not server.loaded, True
+
+            key = "message" if self.path == "/api/chat" else "response"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            with slots:
+                time.sleep(prompt_delay + (load_delay if cold else 0.0))
+                for n in range(tokens):
+                    time.sleep(token_delay)
+                    text = f"token{n} "
+                    body = {"message": {"role": "assistant", "content": text}} if key == "message" else {"response": text}
+                    self.write_chunk({"model": payload.get("model"), "done": False, **body})
+            self.write_chunk({"model": payload.get("model"), "done": True, "eval_count": tokens,
+                              "prompt_eval_count": len(json.dumps(payload)) // 4})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def write_chunk(self, obj):
+            data = (json.dumps(obj) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    lock = threading.Lock()
+    slots = threading.Semaphore(parallel or 10**6)
+    server, base_url = serve(Handler)
+    server.calls = 0
+    server.loaded = False
+    return server, base_url
+
+
+def throttled_server(respond, latency=0.1, rate=20.0, max_concurrent=6, error_rate=0.0):
+    """Fake OpenAI endpoint that throttles like the real API; `respond(payload)` builds the JSON body.
+
+    Requests beyond `rate` per second (token bucket) or `max_concurrent` in
+    flight get a 429 with Retry-After; a further `error_rate` share fail with
+    a 500. The server counts `requests`, `rate_limited` and `errors`.
+    """
+
+    class Handler(QuietHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+
+            with lock:
+                server.requests += 1
+                now = time.monotonic()
+                state["tokens"] = min(rate, state["tokens"] + (now - state["updated"]) * rate)
+                state["updated"] = now
+                throttled = state["tokens"] < 1 or state["active"] >= max_concurrent
+                failed = not throttled and rng.random() < error_rate
+                if throttled:
+                    server.rate_limited += 1
+                elif failed:
+                    server.errors += 1
+                else:
+                    state["tokens"] -= 1
+                    state["active"] += 1
+
+            if throttled:
+                error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                self.send_body(json.dumps(error), "application/json", status=429, headers={"Retry-After": "1"})
+                return
+            if failed:
+                error = {"error": {"message": "The server had an error", "type": "server_error"}}
+                self.send_body(json.dumps(error), "application/json", status=500)
+                return
+
+            try:
+                time.sleep(latency)
+                self.send_body(json.dumps(respond(payload)), "application/json")
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+    lock = threading.Lock()
+    rng = random.Random(0)
+    state = {"tokens": rate, "updated": time.monotonic(), "active": 0}
+    server, base_url = serve(Handler)
+    server.requests = 0
+    server.rate_limited = 0
+    server.errors = 0
+    return server, f"{base_url}/v1"
+
+
+def embedding_server(latency=0.1, rate=20.0, max_concurrent=6, error_rate=0.0, dim=64):
+    """Fake OpenAI /v1/embeddings behind throttled_server(), with FakeEmbeddings vectors."""
+    vectors = FakeEmbeddings(dim=dim)
+
+    def respond(payload):
+        texts = payload.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        data = [{"object": "embedding", "index": i, "embedding": vectors.vector(str(text))}
+                for i, text in enumerate(texts)]
+        return {"object": "list", "data": data, "model": payload.get("model"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    return throttled_server(respond, latency, rate, max_concurrent, error_rate)
+
+
+def chat_server(latency=0.3, rate=20.0, max_concurrent=6, error_rate=0.0, reply=lambda prompt: "PASS"):
+    """Fake OpenAI /v1/chat/completions behind throttled_server(); `reply(prompt)` is the answer text."""
+
+    def respond(payload):
+        prompt = payload["messages"][-1]["content"]
+        return {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": reply(prompt)}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 1, "total_tokens": len(prompt) // 4 + 1},
+        }
+
+    return throttled_server(respond, latency, rate, max_concurrent, error_rate)
+
+
+def api_server(app, wait_ready=True):
+    """Run an ASGI app under uvicorn on a free port in a daemon thread. Returns (server, base_url).
+
+    With `wait_ready`, also waits until the app's /readyz (if it has one) stops
+    answering 503, so callers start against a built and warmed-up pipeline.
+    """
+    import socket
+    import urllib.error
+    import urllib.request
+
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    base_url = f"http://127.0.0.1:{port}"
+
+    while wait_ready:
+        try:
+            urllib.request.urlopen(f"{base_url}/readyz")
+            break
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                break
+            time.sleep(0.02)
+    return server, base_url
+
+
+def load_api_with_stubs(workdir, ollama_url, pages=50, embed_latency=0.0):
+    """Import main_api against a throwaway Chroma store, FakeEmbeddings and a fake Ollama.
+
+    Builds the store with 3_ingest inside `workdir` and chdirs there, because
+    main_api resolves chroma_db and data/ relative to the working directory.
+    `embed_latency` is applied to the API's embedding calls, not to the ingest.
+    """
+    import langchain_openai
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+    os.environ["OLLAMA_BASE_URL"] = ollama_url
+    embeddings = FakeEmbeddings()
+    langchain_openai.OpenAIEmbeddings = lambda **kwargs: embeddings
+
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    write_corpus("data/corpus.jsonl.gz", pages)
+    load_stage("3_ingest").ingest_data(embeddings=embeddings)
+    embeddings.latency = embed_latency
+    return load_stage("main_api"), embeddings
@@ -1,84 +1,200 @@
 import os
 import shutil
 import json
+import hashlib
+import argparse
 from dotenv import load_dotenv
 
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
 
-load_dotenv() 
+from embedding_cache import CachedEmbeddings
+from embedding_scheduler import BATCH_SIZE as EMBED_BATCH_SIZE, MAX_CONCURRENCY, ParallelEmbeddings
+from answer_cache import write_index_version
+from vector_index import export_chroma
+from lexical_index import LexicalIndexBuilder
+from corpus_store import CORPUS_PATH, CorpusStore
+
+load_dotenv()
 
 KEY = os.getenv("OPENAI_API_KEY")
 if not KEY:
     print("Error: OPENAI_API_KEY not found in .env file.")
     exit()
 
-DATA_PATH = "data/scraped_text"
 DB_PATH = "chroma_db"
 
-DEBUG_FILE = "data/all_chunks_debug.json" 
+# One JSON object per chunk, appended as ingest streams
+DEBUG_FILE = "data/all_chunks_debug.jsonl"
+# source URL -> ids of the chunks it produced in the vector store
+MANIFEST_FILE = "data/ingest_manifest.json"
 
-def ingest_data():
-    
+# Each write is split into EMBED_BATCH_SIZE requests that run concurrently, so keep it a multiple
+WRITE_BATCH_SIZE = 1000
 
-    # Load Data
-    if not os.path.exists(DATA_PATH):
-        print(f" Error: {DATA_PATH} not found.")
-        return
+# Memory-mapped copy of the vectors for VECTOR_BACKEND=flat in main_api (inside the db dir)
+FLAT_INDEX_DIR = "flat_index"
+# BM25 inverted index for RETRIEVAL_MODE=hybrid in main_api (inside the db dir)
+LEXICAL_INDEX_DIR = "lexical_index"
+
+
+def chunk_id(source, content):
+    # Same text from the same file always gets the same id, so unchanged chunks are never re-embedded
+    return hashlib.sha256(f"{source}\0{content}".encode("utf-8")).hexdigest()[:32]
+
+
+def load_manifest(manifest_file):
+    if not os.path.exists(manifest_file):
+        return None
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest_file, manifest):
+    tmp = f"{manifest_file}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_file)
+
+
+def assign_chunk_ids(chunks):
+    # Drops repeated identical chunks within one file; Chroma ids must be unique
+    unique = {}
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "unknown")
+        cid = chunk_id(source, chunk.page_content)
+        chunk.metadata["chunk_id"] = cid
+        unique.setdefault(cid, chunk)
+    return list(unique.values())
+
+
+def iter_documents(store):
+    # One page in memory at a time, in corpus order
+    for record in store.iter_records():
+        yield Document(page_content=record["text"], metadata={"source": record["url"], "doc_id": record["id"]})
+
+
+def iter_chunks(documents, text_splitter):
+    for document in documents:
+        yield from assign_chunk_ids(text_splitter.split_documents([document]))
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    print(" Loading text files...")
-    loader = DirectoryLoader(DATA_PATH, glob="*.txt", loader_cls=TextLoader)
-    documents = loader.load()
-    print(f"   Loaded {len(documents)} documents.")
 
-    if len(documents) == 0:
+def ingest_data(full=False, corpus_path=CORPUS_PATH, db_path=DB_PATH, manifest_file=MANIFEST_FILE,
+                debug_file=DEBUG_FILE, embeddings=None, flat_index="float32", embed_concurrency=MAX_CONCURRENCY):
+    """Streams pages -> chunks -> WRITE_BATCH_SIZE embedding batches -> vector store writes.
+
+    Only one batch of chunks is held at a time, so peak memory does not grow
+    with the corpus; what does grow is the id manifest and the BM25 vocabulary.
+    """
+
+    if not os.path.exists(corpus_path):
+        print(f" Error: {corpus_path} not found.")
+        return
+    store = CorpusStore(corpus_path)
+    if len(store) == 0:
         print(" No documents found.")
         return
 
-    #  Split Text
-    print(" Splitting text")
+    # Without a manifest we can't tell which stored vectors belong to which file
+    old_manifest = None if full else load_manifest(manifest_file)
+    if old_manifest is None:
+        print(" Full rebuild (no manifest or --full).")
+        old_manifest = {}
+        if os.path.exists(db_path):
+            shutil.rmtree(db_path)
+    old_ids = {cid for ids in old_manifest.values() for cid in ids}
+
+    if embeddings is None:
+        # Retries are the scheduler's job; each finished batch lands in the cache, so a rerun resumes
+        embeddings = ParallelEmbeddings(CachedEmbeddings(OpenAIEmbeddings(
+            api_key=KEY,
+            chunk_size=EMBED_BATCH_SIZE,
+            max_retries=0
+        )), max_concurrency=embed_concurrency)
+
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=1000,
-        chunk_overlap=200
-    )
-    chunks = text_splitter.split_documents(documents)
-    print(f"   Created {len(chunks)} chunks.")
-
-  
-    print(f" Saving chunks to '{DEBUG_FILE}' for inspection...")
-    
- 
-    chunks_data = []
-    for i, chunk in enumerate(chunks):
-        chunks_data.append({
-            "chunk_id": i,
-            "source": chunk.metadata.get("source", "unknown"),
-            "content": chunk.page_content
-        })
-    
-    with open(DEBUG_FILE, "w", encoding="utf-8") as f:
-        json.dump(chunks_data, f, indent=2, ensure_ascii=False)
-   
-    print(f"Embeddings saving to '{DB_PATH}'...")
-    
-    if os.path.exists(DB_PATH):
-        shutil.rmtree(DB_PATH)
-
-    embeddings = OpenAIEmbeddings(
-        api_key=KEY,
-        chunk_size=100 
+        chunk_overlap=200,
+        # Lets main_api merge neighbouring hits from the same page back together
+        add_start_index=True
     )
-    
-    db = Chroma.from_documents(
-        documents=chunks, 
-        embedding=embeddings, 
-        persist_directory=DB_PATH
-    )
-    
-    print("  Database created.")
-    print(f" chunks in: {DEBUG_FILE}")
+
+    print(f" Streaming '{corpus_path}' into '{db_path}' (chunks listed in '{debug_file}')...")
+    db = Chroma(persist_directory=db_path, embedding_function=embeddings)
+    # No embeddings involved, so rebuilding it from every chunk is cheaper than patching postings
+    lexical = LexicalIndexBuilder(os.path.join(db_path, LEXICAL_INDEX_DIR))
+    new_manifest = {}
+    added = 0
+
+    with open(debug_file, "w", encoding="utf-8") as debug:
+        chunks = iter_chunks(iter_documents(store), text_splitter)
+        for batch in batched(chunks, WRITE_BATCH_SIZE):
+            to_add = []
+            for chunk in batch:
+                cid = chunk.metadata["chunk_id"]
+                source = chunk.metadata.get("source", "unknown")
+                new_manifest.setdefault(source, []).append(cid)
+                lexical.add(cid, chunk.page_content, chunk.metadata)
+                debug.write(json.dumps(
+                    {"chunk_id": cid, "source": source, "content": chunk.page_content}, ensure_ascii=False
+                ) + "\n")
+                if cid not in old_ids:
+                    to_add.append(chunk)
+
+            if to_add:
+                db.add_documents(to_add, ids=[chunk.metadata["chunk_id"] for chunk in to_add])
+                added += len(to_add)
+
+    new_ids = {cid for ids in new_manifest.values() for cid in ids}
+    to_delete = sorted(old_ids - new_ids)
+    for start in range(0, len(to_delete), WRITE_BATCH_SIZE):
+        db.delete(ids=to_delete[start:start + WRITE_BATCH_SIZE])
+
+    print(f"   {len(new_manifest)} documents, {len(new_ids)} chunks: {added} new/changed embedded, "
+          f"{len(to_delete)} stale deleted, {len(new_ids) - added} unchanged.")
+
+    if flat_index != "none" and (added or to_delete or not os.path.exists(os.path.join(db_path, FLAT_INDEX_DIR))):
+        exported = export_chroma(db, os.path.join(db_path, FLAT_INDEX_DIR), quantize=flat_index == "int8")
+        print(f"   Flat {flat_index} index written ({exported} vectors).")
+
+    print(f"   Lexical index written ({lexical.close()} chunks, {len(lexical.terms)} terms).")
+
+    save_manifest(manifest_file, new_manifest)
+    # The API keys cached answers on this, so any change to the chunk set invalidates them
+    index_version = hashlib.sha256("\n".join(sorted(new_ids)).encode("utf-8")).hexdigest()[:16]
+    write_index_version(db_path, index_version)
+
+    print("  Database updated.")
+    if isinstance(embeddings, ParallelEmbeddings):
+        stats = embeddings.stats()
+        print(f"   Embedding requests: {stats['batches']} batches, {stats['retries']} retried "
+              f"({stats['rate_limited']} rate limited), peak concurrency {stats['peak_concurrency']}")
+        embeddings = embeddings.embeddings
+    if isinstance(embeddings, CachedEmbeddings):
+        stats = embeddings.stats()
+        print(f"   Embedding cache: {stats['hits']} hits, {stats['misses']} misses")
+    print(f" chunks in: {debug_file}")
+    return {"added": added, "deleted": len(to_delete), "total": len(new_ids)}
 
 if __name__ == "__main__":
-    ingest_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chunk the scraped pages and index them in Chroma.")
+    parser.add_argument("--full", action="store_true", help="drop the vector store and re-embed everything")
+    parser.add_argument("--flat-index", choices=["float32", "int8", "none"], default="float32",
+                        help="also export a memory-mapped flat index for VECTOR_BACKEND=flat")
+    parser.add_argument("--embed-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="upper bound on concurrent embedding requests (adapts down on 429/5xx)")
+    args = parser.parse_args()
+    ingest_data(full=args.full, flat_index=args.flat_index, embed_concurrency=args.embed_concurrency)
@@ -1,91 +1,177 @@
 import json
 import os
+import random
+import asyncio
+import hashlib
+import argparse
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 
+from embedding_scheduler import BACKOFF_BASE, BACKOFF_MAX, MAX_ATTEMPTS, error_status, is_retryable, retry_after
+
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 INPUT_FILE = "data/benchmark_dataset.json"
 OUTPUT_FILE = "data/benchmark_dataset_clean.json"
+# One line per judged pair, appended as each verdict lands. It is both the checkpoint of a
+# crashed run and the verdict cache of the next one: unchanged pairs are never judged twice
+VERDICTS_FILE = "data/audit_verdicts.jsonl"
+
+AUDIT_MODEL = "gpt-3.5-turbo"
+# Pairs judged at once
+CONCURRENCY = 8
 
 MIN_CONTEXT_LENGTH = 200
 
 def setup_auditor():
-    
-    return ChatOpenAI(model="gpt-3.5-turbo", temperature=0.0, api_key=OPENAI_API_KEY)
+    # Retries are done here, with backoff shared across the batch, not inside the client
+    return ChatOpenAI(model=AUDIT_MODEL, temperature=0.0, api_key=OPENAI_API_KEY, max_retries=0)
+
+def verdict_key(item, model=AUDIT_MODEL):
+    parts = (item.get("context_used", ""), item.get("question", ""), item.get("ground_truth", ""), model)
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+def load_verdicts(verdicts_file):
+    verdicts = {}
+    if os.path.exists(verdicts_file):
+        with open(verdicts_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by a crash
+                verdicts[row["key"]] = row["verdict"]
+    return verdicts
+
+def audit_prompt(item):
+    return f"""
+        You are a Data Quality Auditor.
+        Verify if the ANSWER can be derived EXCLUSIVELY from the CONTEXT.
 
-def audit_dataset():
+        Context: "{item.get("context_used", "")}"
+
+        Question: "{item.get("question")}"
+        Generated Answer: "{item.get("ground_truth")}"
+
+        Rules:
+        1. If the Context is just a header or menu and contains no real info, FAIL.
+        2. If the Answer contains facts NOT present in the Context (External Knowledge), FAIL.
+        3. If the Answer is fully supported by the Context, PASS.
+
+        Reply ONLY with "PASS" or "FAIL".
+        """
+
+async def judge(llm, item, limit, stats):
+    """PASS/FAIL for one pair, retrying throttling and server errors with jittered backoff."""
+    for attempt in range(MAX_ATTEMPTS):
+        async with limit:
+            try:
+                response = await llm.ainvoke(audit_prompt(item))
+                return "PASS" if "PASS" in response.content.strip().upper() else "FAIL"
+            except Exception as e:
+                if not is_retryable(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                stats["retries"] += 1
+                stats["rate_limited"] += int(error_status(e) == 429)
+                wait = retry_after(e) or random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        # Back off outside the semaphore so other pairs keep its slot busy
+        await asyncio.sleep(wait)
+
+async def audit_pairs(llm, model, pending, verdicts, verdicts_file, concurrency, stats):
+    limit = asyncio.Semaphore(concurrency)
+
+    with open(verdicts_file, "a+", encoding="utf-8") as out:
+        if out.tell():
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                # Finish the line a crash cut short so the next verdict starts on its own line
+                out.write("\n")
+        async def audit_one(key, pairs):
+            # Identical pairs share one judge call; the verdict applies to all of them by key
+            i, item = pairs[0]
+            try:
+                verdict = await judge(llm, item, limit, stats)
+            except Exception as e:
+                print(f"Error checking Q{i}: {e}")
+                stats["errors"] += len(pairs)
+                return
+            verdicts[key] = verdict
+            out.write(json.dumps({"key": key, "verdict": verdict, "model": model, "question": item.get("question")},
+                                 ensure_ascii=False) + "\n")
+            out.flush()
+            if verdict == "FAIL":
+                for i, _ in pairs:
+                    print(f"    Q{i}: REJECTED (Hallucination or External Info)")
+
+        await asyncio.gather(*(audit_one(key, pairs) for key, pairs in pending.items()))
+
+def audit_dataset(input_file=INPUT_FILE, output_file=OUTPUT_FILE, verdicts_file=VERDICTS_FILE,
+                  concurrency=CONCURRENCY, llm=None):
     print(" Starting Strict Audit of Benchmark Data.")
-    
-    if not os.path.exists(INPUT_FILE):
-        print(f" Error: {INPUT_FILE} not found.")
+
+    if not os.path.exists(input_file):
+        print(f" Error: {input_file} not found.")
         return
 
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
+    with open(input_file, "r", encoding="utf-8") as f:
         data = json.load(f)
 
-    llm = setup_auditor()
-    valid_data = []
-    
+    llm = llm or setup_auditor()
+    # Verdicts are only reused for the judge model that gave them
+    model = getattr(llm, "model_name", None) or AUDIT_MODEL
+    verdicts = load_verdicts(verdicts_file)
+
     stats = {
         "total": len(data),
         "deleted_empty": 0,
         "deleted_hallucination": 0,
-        "kept": 0
+        "errors": 0,
+        "kept": 0,
+        "cached": 0,
+        "duplicates": 0,
+        "retries": 0,
+        "rate_limited": 0,
     }
 
     print(f"   Reviewing {len(data)} generated Q&A pairs.\n")
 
+    # verdict_key -> [(index, pair)], so exact duplicates are judged once
+    pending = {}
     for i, item in enumerate(data):
-        question = item.get("question")
-        answer = item.get("ground_truth")
-        context = item.get("context_used", "") 
-        
-       
+        context = item.get("context_used", "")
+
         if len(context) < MIN_CONTEXT_LENGTH:
             print(f"    Q{i}: REJECTED (Context too short : likely just URL)")
             stats["deleted_empty"] += 1
             continue
 
-    
-        prompt = f"""
-        You are a Data Quality Auditor.
-        Verify if the ANSWER can be derived EXCLUSIVELY from the CONTEXT.
-
-        Context: "{context}"
-        
-        Question: "{question}"
-        Generated Answer: "{answer}"
+        key = verdict_key(item, model)
+        if key in verdicts:
+            stats["cached"] += 1
+        else:
+            stats["duplicates"] += key in pending
+            pending.setdefault(key, []).append((i, item))
 
-        Rules:
-        1. If the Context is just a header or menu and contains no real info, FAIL.
-        2. If the Answer contains facts NOT present in the Context (External Knowledge), FAIL.
-        3. If the Answer is fully supported by the Context, PASS.
-        
-        Reply ONLY with "PASS" or "FAIL".
-        """
+    if pending:
+        print(f"   {stats['cached']} verdicts cached, {stats['duplicates']} exact duplicates, "
+              f"judging {len(pending)} pairs ({concurrency} at a time).\n")
+        asyncio.run(audit_pairs(llm, model, pending, verdicts, verdicts_file, concurrency, stats))
 
-        try:
-            response = llm.invoke(prompt)
-            verdict = response.content.strip().upper()
-            
-            if "PASS" in verdict:
-                
-                valid_data.append(item)
-                stats["kept"] += 1
-            else:
-                print(f"    Q{i}: REJECTED (Hallucination or External Info)")
-                
-            
-                stats["deleted_hallucination"] += 1
-                
-        except Exception as e:
-            print(f"Error checking Q{i}: {e}")
-
-    
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+    # Original order; pairs whose audit failed after every retry are neither kept nor rejected
+    valid_data = []
+    for item in data:
+        if len(item.get("context_used", "")) < MIN_CONTEXT_LENGTH:
+            continue
+        verdict = verdicts.get(verdict_key(item, model))
+        if verdict == "PASS":
+            valid_data.append(item)
+            stats["kept"] += 1
+        elif verdict == "FAIL":
+            stats["deleted_hallucination"] += 1
+
+    with open(output_file, "w", encoding="utf-8") as f:
         json.dump(valid_data, f, indent=2)
 
     print("\n" + "="*30)
@@ -93,9 +179,15 @@ def audit_dataset():
     print(f"   Total Original:       {stats['total']}")
     print(f"    Deleted (URL Only): {stats['deleted_empty']}")
     print(f"    Deleted (Made Up):  {stats['deleted_hallucination']}")
+    print(f"    Not Audited (error): {stats['errors']}  (rerun to retry them)")
     print(f"    Final Clean Set:    {stats['kept']}")
-    print(f"    Saved to: {OUTPUT_FILE}")
+    print(f"    Verdicts from cache: {stats['cached']}, shared by duplicates: {stats['duplicates']}, retries: {stats['retries']} ({stats['rate_limited']} rate limited)")
+    print(f"    Saved to: {output_file}")
     print("="*30)
+    return stats
 
 if __name__ == "__main__":
-    audit_dataset()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Drop generated Q&A pairs the context does not support.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help=f"pairs judged at once (default: {CONCURRENCY})")
+    args = parser.parse_args()
+    audit_dataset(concurrency=args.concurrency)
@@ -1,10 +1,10 @@
 import os
 import json
 import random
+import asyncio
+import argparse
 from typing import List
 from dotenv import load_dotenv
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
@@ -13,11 +13,15 @@ from pydantic import BaseModel, Field
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DATA_PATH = "data/scraped_text"
+# Written by 3_ingest.py: every indexed chunk with its id and source URL, so questions
+# point at chunks that really are in the vector store
+CHUNKS_FILE = "data/all_chunks_debug.jsonl"
 OUTPUT_FILE = "data/benchmark_dataset.json"
 
 
 NUM_CHUNKS_TO_SAMPLE = 20 
+# Chunks sent to the generator model at once
+CONCURRENCY = 8
 
 
 class QAPair(BaseModel):
@@ -27,27 +31,38 @@ class QAPair(BaseModel):
 class DatasetOutput(BaseModel):
     qa_pairs: List[QAPair] = Field(description="List of 3 question-answer pairs")
 
-def generate_questions():
+def sample_chunks(chunks_file, size, rng=random):
+    """Uniform sample of `size` chunks in one pass over the log (reservoir sampling).
+
+    Only the kept lines are held and parsed, so memory depends on `size`, not on the corpus.
+    """
+    reservoir = []
+    seen = 0
+    with open(chunks_file, "r", encoding="utf-8") as f:
+        for line in f:
+            seen += 1
+            if len(reservoir) < size:
+                reservoir.append(line)
+            else:
+                slot = rng.randrange(seen)
+                if slot < size:
+                    reservoir[slot] = line
+    return [json.loads(line) for line in reservoir], seen
+
+def generate_questions(num_chunks=NUM_CHUNKS_TO_SAMPLE, concurrency=CONCURRENCY, seed=None,
+                       chunks_file=CHUNKS_FILE, output_file=OUTPUT_FILE, llm=None):
     print(" Starting User-Centric Dataset Generation.")
 
-    #  Load & Chunk
-    if not os.path.exists(DATA_PATH):
-        print(f"Error: {DATA_PATH} not found.")
+    #  Sample the indexed chunks
+    if not os.path.exists(chunks_file):
+        print(f"Error: {chunks_file} not found. Run 3_ingest.py first.")
         return
 
-    loader = DirectoryLoader(DATA_PATH, glob="*.txt", loader_cls=TextLoader)
-    documents = loader.load()
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    all_chunks = text_splitter.split_documents(documents)
-    
-    
-    sample_size = min(NUM_CHUNKS_TO_SAMPLE, len(all_chunks))
-    selected_chunks = random.sample(all_chunks, sample_size)
-    print(f"   Selected {len(selected_chunks)} chunks to generate scenario questions from.")
+    selected_chunks, total_chunks = sample_chunks(chunks_file, num_chunks, random.Random(seed))
+    print(f"   Selected {len(selected_chunks)} of {total_chunks} chunks to generate scenario questions from.")
 
     # Setup the Scenario Generator LLM
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7, api_key=OPENAI_API_KEY)
+    llm = llm or ChatOpenAI(model="gpt-3.5-turbo", temperature=0.7, api_key=OPENAI_API_KEY)
     parser = JsonOutputParser(pydantic_object=DatasetOutput)
 
    
@@ -77,35 +92,45 @@ def generate_questions():
 
     chain = prompt | llm | parser
 
-    #  Loop and Generate
+    #  Generate, `concurrency` chunks at a time; a failed chunk doesn't sink the batch
     final_dataset = []
-    
-    print("This takes a minute")
-    for i, chunk in enumerate(selected_chunks):
+
+    print(f"This takes a minute ({concurrency} chunks at a time)")
+    results = asyncio.run(chain.abatch(
+        [{"context": chunk["content"], "format_instructions": parser.get_format_instructions()} for chunk in selected_chunks],
+        config={"max_concurrency": concurrency},
+        return_exceptions=True,
+    ))
+
+    skipped = 0
+    for i, (chunk, result) in enumerate(zip(selected_chunks, results)):
         try:
-            print(f"   Processing chunk {i+1}/{len(selected_chunks)}...")
-            
-            result = chain.invoke({
-                "context": chunk.page_content,
-                "format_instructions": parser.get_format_instructions()
-            })
-            
+            if isinstance(result, Exception):
+                raise result
             for pair in result["qa_pairs"]:
                 final_dataset.append({
                     "question": pair["question"],
                     "ground_truth": pair["answer"],
-                    "context_used": chunk.page_content, 
-                    "source_chunk_id": i
+                    "context_used": chunk["content"], 
+                    "source_chunk_id": chunk["chunk_id"],
+                    "source_url": chunk["source"]
                 })
-                
         except Exception as e:
+            skipped += 1
             print(f"  Skipped chunk {i}: {e}")
 
     
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+    with open(output_file, "w", encoding="utf-8") as f:
         json.dump(final_dataset, f, indent=2)
 
-    print(f"Success . Saved {len(final_dataset)} realistic questions to '{OUTPUT_FILE}'")
+    print(f"Success . Saved {len(final_dataset)} realistic questions to '{output_file}' ({skipped} chunks skipped)")
+    return final_dataset
 
 if __name__ == "__main__":
-    generate_questions()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate scenario questions from chunks indexed by 3_ingest.py.")
+    parser.add_argument("--chunks", type=int, default=NUM_CHUNKS_TO_SAMPLE,
+                        help=f"chunks to sample, about 3 questions each (default: {NUM_CHUNKS_TO_SAMPLE})")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help=f"chunks generated at once (default: {CONCURRENCY})")
+    parser.add_argument("--seed", type=int, default=None, help="sampling seed, for a reproducible chunk selection")
+    args = parser.parse_args()
+    generate_questions(num_chunks=args.chunks, concurrency=args.concurrency, seed=args.seed)
@@ -1,6 +1,10 @@
 import json
+import math
 import time
 import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from langchain_community.chat_models import ChatOllama
 from langchain_openai import OpenAIEmbeddings
@@ -9,19 +13,38 @@ from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_core.prompts import ChatPromptTemplate
 
+from embedding_cache import CachedEmbeddings
+from metrics import RequestTimings, current_timings, percentile, timed
+from retrieval import HYBRID_FETCH_K, RETRIEVAL_MODE, VECTOR_BACKEND, build_retriever
+from stage_timing import StageTimer, TimedEmbeddings
+
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 DATASET_FILE = "data/benchmark_dataset_clean.json"
+# One JSON line per graded question, appended as soon as it finishes; a rerun skips what is already here
+RESULTS_FILE = "data/benchmark_results.jsonl"
+REPORT_FILE = "data/benchmark_report.json"
+RETRIEVAL_REPORT_FILE = "data/retrieval_report.json"
+# Chunk log written by 3_ingest.py; maps the context_used of older datasets to chunk ids
+CHUNKS_FILE = "data/all_chunks_debug.jsonl"
 DB_PATH = "chroma_db"
 MODEL_NAME = "llama3"
 
+EVAL_KS = (1, 3, 5, 10)
+
+# Questions in flight at once. Ollama only overlaps them up to its OLLAMA_NUM_PARALLEL,
+# but retrieval, embedding and the judge of other questions still run meanwhile
+WORKERS = 4
+PERCENTILES = (50, 90, 99)
+
 def setup_rag_system():
     """Re-creates your RAG logic with STRICT rules (Same as main_api.py)"""
-    embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
+    embeddings = TimedEmbeddings(CachedEmbeddings(OpenAIEmbeddings(api_key=OPENAI_API_KEY)))
     vector_db = Chroma(persist_directory=DB_PATH, embedding_function=embeddings)
     
     
-    llm = ChatOllama(model=MODEL_NAME, temperature=0.0) 
+    llm = ChatOllama(model=MODEL_NAME, temperature=0.0, base_url=OLLAMA_BASE_URL) 
     
    
     prompt = ChatPromptTemplate.from_template("""
@@ -44,13 +67,15 @@ def setup_rag_system():
     retriever = vector_db.as_retriever(search_kwargs={"k": 3})
     return create_retrieval_chain(retriever, doc_chain)
 
-def llm_judge(question, ground_truth, student_answer):
+def setup_judge():
+    # One client for the whole run; it is stateless, so the worker threads share it
+    return ChatOllama(model=MODEL_NAME, temperature=0.0, base_url=OLLAMA_BASE_URL)
+
+def llm_judge(judge_llm, question, ground_truth, student_answer):
     """
     STRICT JUDGE: Compares Student Answer vs Ground Truth.
     """
     
-    judge_llm = ChatOllama(model="llama3", temperature=0.0)
-    
     prompt = f"""
     You are a strict exam grader. 
     Compare the STUDENT ANSWER to the GROUND TRUTH.
@@ -74,7 +99,173 @@ def llm_judge(question, ground_truth, student_answer):
     
     return "FAIL"
 
-def run_benchmark():
+def load_results(results_file):
+    # Last line per question wins; errored questions are not counted as done, so they run again
+    results = {}
+    if os.path.exists(results_file):
+        with open(results_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # a line cut short by a crash
+                results[row["question"]] = row
+    return results
+
+def evaluate(rag_chain, judge_llm, index, item):
+    """Answers and grades one question; runs on a worker thread."""
+    timings = RequestTimings()
+    current_timings.set(timings)
+    question = item["question"]
+    row = {"index": index, "question": question, "ground_truth": item["ground_truth"]}
+
+    start = time.perf_counter()
+    try:
+        result = rag_chain.invoke({"input": question}, config={"callbacks": [StageTimer()]})
+        row["answer"] = result["answer"]
+        row["sources"] = [doc.metadata.get("source") for doc in result.get("context", [])]
+    except Exception as e:
+        row["answer"] = "Error generating answer"
+        row["error"] = f"answer: {e}"
+
+    try:
+        with timed("judge"):
+            row["grade"] = llm_judge(judge_llm, question, item["ground_truth"], row["answer"])
+    except Exception as e:
+        row["grade"] = "FAIL"
+        row["error"] = f"judge: {e}"
+
+    timings.add("total", time.perf_counter() - start)
+    row.update(timings.as_dict())
+    return row
+
+def summarise(rows):
+    stages = {}
+    for row in rows:
+        for stage, ms in row.get("stages_ms", {}).items():
+            stages.setdefault(stage, []).append(ms)
+
+    score = sum(1 for row in rows if row["grade"] == "PASS")
+    return {
+        "questions": len(rows),
+        "correct": score,
+        "accuracy": round(score / len(rows) * 100, 1) if rows else 0.0,
+        "errors": sum(1 for row in rows if "error" in row),
+        "stages_ms": {
+            stage: {f"p{q}": round(percentile(values, q), 1) for q in PERCENTILES} | {"max": max(values)}
+            for stage, values in sorted(stages.items())
+        },
+    }
+
+def resolve_targets(qa_pairs, chunks_file=CHUNKS_FILE):
+    """(chunk_id, source_url) each question was generated from.
+
+    Datasets from before chunk ids were recorded only have the chunk text;
+    those are looked up in the ingest chunk log, and are None if the chunk no
+    longer exists (re-chunked or removed since).
+    """
+    by_content = None
+    targets = []
+    for item in qa_pairs:
+        if isinstance(item.get("source_chunk_id"), str):
+            targets.append((item["source_chunk_id"], item.get("source_url")))
+            continue
+        if by_content is None:
+            by_content = {}
+            if os.path.exists(chunks_file):
+                with open(chunks_file, "r", encoding="utf-8") as f:
+                    for line in f:
+                        chunk = json.loads(line)
+                        by_content[chunk["content"]] = (chunk["chunk_id"], chunk["source"])
+        targets.append(by_content.get(item.get("context_used"), (None, None)))
+    return targets
+
+def first_hit(values, target):
+    # 1-based rank of the first match, or None
+    for rank, value in enumerate(values, 1):
+        if value == target:
+            return rank
+    return None
+
+def ranking_metrics(ranks, ks):
+    # One relevant item per question, so nDCG@k is 1/log2(rank + 1) when it is found in the top k
+    n = len(ranks)
+    metrics = {f"recall@{k}": sum(1 for r in ranks if r and r <= k) / n for k in ks}
+    metrics["mrr"] = sum(1 / r for r in ranks if r) / n
+    metrics.update({f"ndcg@{k}": sum(1 / math.log2(r + 1) for r in ranks if r and r <= k) / n for k in ks})
+    return {name: round(value, 4) for name, value in metrics.items()}
+
+def run_retrieval_benchmark(k=max(EVAL_KS), workers=WORKERS, report_file=RETRIEVAL_REPORT_FILE):
+    """Scores retrieval alone against each question's source chunk: no Ollama, no judge.
+
+    Chunk-level metrics need the exact chunk back; page-level ones accept any
+    chunk from the same URL, which stays comparable across chunking changes.
+    """
+    if not os.path.exists(DATASET_FILE):
+        print(f" Error: {DATASET_FILE} not found. Run '4_audit_dataset.py' first.")
+        return
+
+    with open(DATASET_FILE, "r", encoding="utf-8") as f:
+        qa_pairs = json.load(f)
+
+    targets = resolve_targets(qa_pairs)
+    scored = [(item, target) for item, target in zip(qa_pairs, targets) if target[0]]
+    print(f"   Loaded {len(qa_pairs)} questions, {len(scored)} with a known source chunk.")
+    if not scored:
+        print(" No question can be scored; regenerate the dataset with 4_generate_dataset.py.")
+        return
+
+    embeddings = TimedEmbeddings(CachedEmbeddings(OpenAIEmbeddings(api_key=OPENAI_API_KEY)))
+    # The API's own retriever and settings (VECTOR_BACKEND, RETRIEVAL_MODE), so this measures what it serves
+    retriever = build_retriever(embeddings, k, db_path=DB_PATH, vector_backend=VECTOR_BACKEND,
+                                retrieval_mode=RETRIEVAL_MODE, fetch_k=HYBRID_FETCH_K)
+    ks = tuple(n for n in EVAL_KS if n <= k)
+
+    def retrieve(question):
+        start = time.perf_counter()
+        docs = retriever.invoke(question)[:k]
+        return docs, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(retrieve, [item["question"] for item, _ in scored]))
+    elapsed = time.perf_counter() - start
+
+    chunk_ranks, page_ranks, latencies, rows = [], [], [], []
+    for (item, (chunk_id, url)), (docs, ms) in zip(scored, results):
+        chunk_rank = first_hit([doc.metadata.get("chunk_id") for doc in docs], chunk_id)
+        page_rank = first_hit([doc.metadata.get("source") for doc in docs], url) if url else chunk_rank
+        chunk_ranks.append(chunk_rank)
+        page_ranks.append(page_rank)
+        latencies.append(ms)
+        rows.append({"question": item["question"], "chunk_id": chunk_id, "chunk_rank": chunk_rank, "page_rank": page_rank})
+
+    report = {
+        "questions": len(scored),
+        "k": k,
+        "vector_backend": VECTOR_BACKEND,
+        "retrieval_mode": RETRIEVAL_MODE,
+        "chunk": ranking_metrics(chunk_ranks, ks),
+        "page": ranking_metrics(page_ranks, ks),
+        "retrieve_ms": {f"p{q}": round(percentile(latencies, q), 1) for q in PERCENTILES},
+        "wall_seconds": round(elapsed, 2),
+        "results": rows,
+    }
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print("\n" + "="*30)
+    print(f"RETRIEVAL ({VECTOR_BACKEND}, {RETRIEVAL_MODE}, k={k}): {len(scored)} questions in {elapsed:.1f}s")
+    columns = [f"recall@{n}" for n in ks] + ["mrr"] + [f"ndcg@{n}" for n in ks]
+    print("   " + f"{'':<6}" + "".join(f"{c:>10}" for c in columns))
+    for level in ("chunk", "page"):
+        print("   " + f"{level:<6}" + "".join(f"{report[level][c]:>10.3f}" for c in columns))
+    print(f"   retrieve p50 {report['retrieve_ms']['p50']:.0f}ms, p99 {report['retrieve_ms']['p99']:.0f}ms")
+    print(f"   Report: {report_file}")
+    print("="*30)
+    return report
+
+def run_benchmark(workers=WORKERS, fresh=False, results_file=RESULTS_FILE, report_file=REPORT_FILE):
     
     
     #  Load Data
@@ -86,49 +277,74 @@ def run_benchmark():
         qa_pairs = json.load(f)
     
     print(f"   Loaded {len(qa_pairs)} validated questions.")
+
+    if fresh and os.path.exists(results_file):
+        os.remove(results_file)
+    done = {q: row for q, row in load_results(results_file).items() if "error" not in row}
+    pending = [(i, item) for i, item in enumerate(qa_pairs) if item["question"] not in done]
+    if done:
+        print(f"   Resuming: {len(qa_pairs) - len(pending)} already graded in '{results_file}', {len(pending)} to go.")
     
-    # Setup Bot
+    # Setup Bot and judge once, shared by every worker
     rag_chain = setup_rag_system()
-    
-    score = 0
-    total = len(qa_pairs)
-    
-    for i, item in enumerate(qa_pairs):
-        question = item["question"]
-        truth = item["ground_truth"]
-        
-        print(f"\n Q{i+1}: {question}")
-        
-        # Ask RAG Bot
-        try:
-            
-            result = rag_chain.invoke({"input": question})
-            student_answer = result["answer"]
-        except Exception as e:
-            student_answer = "Error generating answer"
-
-        
-        print(f"      Expected: {truth}")
-        print(f"      Got:      {student_answer}")
+    judge_llm = setup_judge()
 
-    
-        grade = llm_judge(question, truth, student_answer)
-        
-        if grade == "PASS":
-            print(f"    RESULT: PASS")
-            score += 1
-        else:
-            print(f"    RESULT: FAIL")
-
-    # 5. Final Score
-    if total > 0:
-        accuracy = (score / total) * 100
+    if os.path.exists(results_file) and os.path.getsize(results_file):
+        with open(results_file, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+        if torn:
+            # Finish the line a crash cut short so the next result starts on its own line
+            with open(results_file, "a", encoding="utf-8") as f:
+                f.write("\n")
+
+    write_lock = threading.Lock()
+    start = time.perf_counter()
+    with open(results_file, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(evaluate, rag_chain, judge_llm, i, item) for i, item in pending]
+        for n, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            with write_lock:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+            done[row["question"]] = row
+
+            print(f"\n [{n}/{len(pending)}] Q{row['index']+1}: {row['question']}")
+            print(f"      Expected: {row['ground_truth']}")
+            print(f"      Got:      {row['answer']}")
+            print(f"    RESULT: {row['grade']}" + (f" ({row['error']})" if "error" in row else ""))
+    elapsed = time.perf_counter() - start
+
+    # 5. Final Score, over this run and any resumed one
+    questions = {item["question"] for item in qa_pairs}
+    report = summarise([row for q, row in done.items() if q in questions])
+    report.update(workers=workers, wall_seconds=round(elapsed, 1), answered_this_run=len(pending))
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if report["questions"] > 0:
         print("\n" + "="*30)
-        print(f"FINAL ACCURACY: {accuracy:.1f}%")
-        print(f"   Correct: {score}/{total}")
+        print(f"FINAL ACCURACY: {report['accuracy']:.1f}%")
+        print(f"   Correct: {report['correct']}/{report['questions']}  (errors: {report['errors']})")
+        print(f"   This run: {len(pending)} questions in {elapsed:.1f}s with {workers} workers")
+        print(f"   {'stage':<16}" + "".join(f"{'p' + str(q):>9}" for q in PERCENTILES) + f"{'max':>9}")
+        for stage, stats in report["stages_ms"].items():
+            print(f"   {stage:<16}" + "".join(f"{stats['p' + str(q)]:>7.0f}ms" for q in PERCENTILES) + f"{stats['max']:>7.0f}ms")
+        print(f"   Report: {report_file}")
         print("="*30)
     else:
         print("No questions found in dataset.")
+    return report
 
 if __name__ == "__main__":
-    run_benchmark()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Answer and grade the benchmark dataset.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help=f"questions evaluated at once (default: {WORKERS})")
+    parser.add_argument("--fresh", action="store_true", help=f"discard '{RESULTS_FILE}' instead of resuming from it")
+    parser.add_argument("--retrieval-only", action="store_true",
+                        help="score retrieval (recall@k, MRR, nDCG) against the source chunks; no LLM calls")
+    parser.add_argument("--k", type=int, default=max(EVAL_KS), help="documents retrieved per question in --retrieval-only")
+    args = parser.parse_args()
+    if args.retrieval_only:
+        run_retrieval_benchmark(k=args.k, workers=args.workers)
+    else:
+        run_benchmark(workers=args.workers, fresh=args.fresh)
@@ -0,0 +1,113 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cosine similarity above which a different phrasing reuses a cached answer; 0 disables the tier
+SEMANTIC_THRESHOLD = float(os.getenv("ANSWER_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+INDEX_VERSION_FILE = "index_version"
+
+
+def write_index_version(db_path, version):
+    with open(os.path.join(db_path, INDEX_VERSION_FILE), "w", encoding="utf-8") as f:
+        f.write(version)
+
+
+def read_index_version(db_path):
+    try:
+        with open(os.path.join(db_path, INDEX_VERSION_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return "unversioned"
+
+
+def normalise_question(text):
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip(" ?!.")
+
+
+class AnswerCache:
+    """TTL + LRU cache of final answers keyed on (normalised question, model, index version).
+
+    With a semantic threshold set, an exact miss falls back to comparing the
+    query embedding against cached questions for the same model and index.
+    Entries from an older index version are dropped as soon as a newer one is seen.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, semantic_threshold=SEMANTIC_THRESHOLD,
+                 embed_query=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold if embed_query else 0
+        self.embed_query = embed_query
+        self.entries = OrderedDict()
+        self.index_version = None
+        self.lock = threading.Lock()
+        self.counts = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    def _check_version(self, index_version):
+        if index_version != self.index_version:
+            self.entries.clear()
+            self.index_version = index_version
+
+    def _vector(self, question):
+        vector = np.asarray(self.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, question, model, index_version):
+        key = (normalise_question(question), model)
+        now = time.monotonic()
+
+        with self.lock:
+            self._check_version(index_version)
+            entry = self.entries.get(key)
+            if entry and now - entry["created"] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.counts["exact_hits"] += 1
+                return entry["answer"]
+            if entry:
+                del self.entries[key]
+            # The O(n) scan is only worth it when the semantic tier is on
+            candidates = [
+                (k, e) for k, e in self.entries.items()
+                if k[1] == model and e["vector"] is not None and now - e["created"] <= self.ttl
+            ] if self.semantic_threshold else []
+
+        if candidates:
+            vector = self._vector(question)
+            matrix = np.stack([e["vector"] for _, e in candidates])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.semantic_threshold:
+                best_key, best_entry = candidates[best]
+                with self.lock:
+                    if best_key in self.entries:
+                        self.entries.move_to_end(best_key)
+                    self.counts["semantic_hits"] += 1
+                return best_entry["answer"]
+
+        with self.lock:
+            self.counts["misses"] += 1
+        return None
+
+    def put(self, question, model, index_version, answer):
+        vector = self._vector(question) if self.semantic_threshold else None
+        key = (normalise_question(question), model)
+
+        with self.lock:
+            self._check_version(index_version)
+            self.entries[key] = {"answer": answer, "vector": vector, "created": time.monotonic()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, entries=len(self.entries))
@@ -1,62 +1,166 @@
 import os
-from langdetect import detect, LangDetectException
+import json
+import zlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
-DATA_DIR = "data/scraped_text"
+import numpy as np
+from langdetect import DetectorFactory, detect, LangDetectException
 
-def clean_files():
-    if not os.path.exists(DATA_DIR):
-        print(f" Error: Directory '{DATA_DIR}' not found.")
+from corpus_store import CORPUS_PATH, CorpusStore
+from crawl_state import STATE_FILE, CrawlState
+
+# One line per deleted page: what was dropped and why
+REPORT_FILE = "data/clean_report.jsonl"
+# Records handed to the process pool at a time, so the corpus is never all in memory
+POOL_WINDOW = 512
+
+# langdetect is pure Python and slows down with text length; a few slices decide the language just as well
+LANG_SAMPLE_CHARS = 1500
+LANG_SAMPLE_SLICES = 3
+
+# MinHash over word 5-grams; LSH with 16 bands of 8 rows finds pairs above ~0.7 Jaccard,
+# which are then confirmed against DUPLICATE_THRESHOLD
+SHINGLE_SIZE = 5
+NUM_PERM = 128
+LSH_BANDS = 16
+DUPLICATE_THRESHOLD = 0.85
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+_perm_rng = np.random.RandomState(1)
+PERM_A = _perm_rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _perm_rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+
+# Same verdict for the same text on every run
+DetectorFactory.seed = 0
+
+
+def language_sample(text):
+    if len(text) <= LANG_SAMPLE_CHARS:
+        return text
+    size = LANG_SAMPLE_CHARS // LANG_SAMPLE_SLICES
+    step = (len(text) - size) // (LANG_SAMPLE_SLICES - 1)
+    return " ".join(text[i * step:i * step + size] for i in range(LANG_SAMPLE_SLICES))
+
+
+def minhash(text):
+    words = text.lower().split()
+    shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(1, len(words) - SHINGLE_SIZE + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # Overflow in a * h wraps modulo 2^64; still a fine hash family for MinHash
+    with np.errstate(over="ignore"):
+        permuted = ((hashes[:, None] * PERM_A + PERM_B) % MERSENNE_PRIME) & MAX_HASH
+    return permuted.min(axis=0)
+
+
+def inspect_record(record):
+    """Runs in a worker process: language verdict and MinHash signature for one page."""
+    body = record["text"].strip()
+    result = {"id": record["id"], "source": record["url"], "reason": None, "length": len(body)}
+
+    if not body:
+        result["reason"] = "empty"
+        return result
+
+    try:
+        lang = detect(language_sample(body))
+    except LangDetectException:
+        result["reason"] = "junk"
+        return result
+    if lang != "en":
+        result["reason"] = "language"
+        result["lang"] = lang
+        return result
+
+    result["signature"] = minhash(body)
+    return result
+
+
+def find_near_duplicates(documents):
+    """Marks near-duplicates in place; the longest document of each group is kept."""
+    rows = NUM_PERM // LSH_BANDS
+    buckets = {}
+    kept = []
+    for doc in sorted(documents, key=lambda d: (-d["length"], d["source"])):
+        signature = doc["signature"]
+        bands = [signature[b * rows:(b + 1) * rows].tobytes() for b in range(LSH_BANDS)]
+        candidates = {i for band, key in enumerate(bands) for i in buckets.get((band, key), ())}
+
+        best, best_similarity = None, 0.0
+        for i in candidates:
+            similarity = float(np.mean(kept[i]["signature"] == signature))
+            if similarity > best_similarity:
+                best, best_similarity = i, similarity
+
+        if best is not None and best_similarity >= DUPLICATE_THRESHOLD:
+            doc["reason"] = "near_duplicate"
+            doc["duplicate_of"] = kept[best]["source"]
+            doc["similarity"] = round(best_similarity, 3)
+            continue
+
+        for band, key in enumerate(bands):
+            buckets.setdefault((band, key), []).append(len(kept))
+        kept.append(doc)
+
+
+def clean_files(corpus_path=CORPUS_PATH, report_file=REPORT_FILE, workers=None, dry_run=False, state_file=STATE_FILE):
+    if not os.path.exists(corpus_path):
+        print(f" Error: Corpus '{corpus_path}' not found.")
         return
 
-    print(f"Starting cleanup in '{DATA_DIR}'...")
-    
-    files = [f for f in os.listdir(DATA_DIR) if f.endswith(".txt")]
-    deleted_empty = 0
-    deleted_non_english = 0
-    kept = 0
+    print(f"Starting cleanup of '{corpus_path}'...")
 
-    for filename in files:
-        filepath = os.path.join(DATA_DIR, filename)
-        
-        try:
-            
-            with open(filepath, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-
-            
-            if not content:
-                print(f"Deleting EMPTY file: {filename}")
-                f.close() 
-                os.remove(filepath)
-                deleted_empty += 1
+    store = CorpusStore(corpus_path)
+    records = store.iter_records()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            window = list(islice(records, POOL_WINDOW))
+            if not window:
+                break
+            results.extend(pool.map(inspect_record, window, chunksize=32))
+
+    find_near_duplicates([r for r in results if "signature" in r])
+
+    counts = {"empty": 0, "junk": 0, "language": 0, "near_duplicate": 0}
+    kept = 0
+    # The drop is recorded in the crawl state too, so neither the next crawl nor a
+    # re-extraction puts the page back while its content is unchanged
+    state = CrawlState(state_file)
+    with open(report_file, "w", encoding="utf-8") as report:
+        for result in results:
+            result.pop("signature", None)
+            if result["reason"] is None:
+                kept += 1
                 continue
+            counts[result["reason"]] += 1
+            report.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if not dry_run:
+                store.delete(result["id"], reason=result["reason"])
+                state.mark_dropped(result["source"], result["reason"])
 
-            
-            try:
-                lang = detect(content)
-                
-                if lang != 'en':
-                    print(f" Deleting {lang.upper()} file: {filename}")
-                    os.remove(filepath)
-                    deleted_non_english += 1
-                else:
-                    kept += 1
-                    
-            except LangDetectException:
-            
-                print(f" Could not detect language (Junk data): {filename}")
-                os.remove(filepath)
-                deleted_empty += 1
-
-        except Exception as e:
-            print(f" Error processing {filename}: {e}")
+    if not dry_run and kept < len(results):
+        # Tombstones are appended; rewriting drops the deleted pages from the file itself
+        store.compact()
+    store.close()
+    if not dry_run:
+        state.save()
 
     print("-" * 30)
-    print(" Cleanup Complete!")
-    print(f"    Deleted Empty/Junk: {deleted_empty}")
-    print(f"    Deleted Non-English: {deleted_non_english}")
-    print(f"    Files Remaining:     {kept}")
+    print(" Cleanup Complete!" + (" (dry run, nothing deleted)" if dry_run else ""))
+    print(f"    Deleted Empty/Junk: {counts['empty'] + counts['junk']}")
+    print(f"    Deleted Non-English: {counts['language']}")
+    print(f"    Deleted Near-Duplicates: {counts['near_duplicate']}")
+    print(f"    Pages Remaining:     {kept}")
+    print(f"    Report: {report_file}")
     print("-" * 30)
+    return dict(counts, kept=kept)
 
 if __name__ == "__main__":
-    clean_files()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Drop empty, non-English and near-duplicate pages from the corpus.")
+    parser.add_argument("--workers", type=int, default=None, help="cleaning processes (default: one per CPU)")
+    parser.add_argument("--dry-run", action="store_true", help="write the report without deleting anything")
+    args = parser.parse_args()
+    clean_files(workers=args.workers, dry_run=args.dry_run)
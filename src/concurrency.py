@@ -0,0 +1,180 @@
+import asyncio
+import math
+import os
+import time
+
+MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+# Expected seconds per generation until one has been measured; unset means "unknown" and
+# Retry-After stays at the minimum until the first slot is released
+SERVICE_TIME = float(os.getenv("LLM_SERVICE_TIME", "0")) or None
+# Never tell clients to stay away longer than this, whatever the estimate says
+RETRY_AFTER_MAX = int(os.getenv("LLM_RETRY_AFTER_MAX", "30"))
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class FlightCancelled(Exception):
+    def __init__(self):
+        super().__init__("the shared generation was cancelled")
+
+
+class Slot:
+    """One admitted request. `release()` is idempotent so every exit path can call it."""
+
+    def __init__(self, limiter, wait, queue_depth):
+        self.limiter = limiter
+        self.wait = wait
+        self.queue_depth = queue_depth
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.limiter._release(time.monotonic() - self.started)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class AdmissionLimiter:
+    """Bounded concurrency with a bounded wait queue in front of the LLM backend.
+
+    Up to `max_in_flight` requests run at once and up to `max_queue` more wait
+    their turn; anything beyond that is rejected with QueueFull straight away
+    instead of piling up until everything times out together.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue=MAX_QUEUE, service_time=SERVICE_TIME):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.waiting = 0
+        self.in_flight = 0
+        # Moving average of how long a slot is held, for Retry-After; None until measured
+        self.service_time = service_time
+
+    def retry_after(self):
+        if self.service_time is None:
+            return 1
+        estimate = math.ceil(self.service_time * (self.waiting + 1) / self.max_in_flight)
+        return min(RETRY_AFTER_MAX, max(1, estimate))
+
+    async def acquire(self):
+        if self.semaphore.locked() and self.waiting >= self.max_queue:
+            raise QueueFull(self.retry_after())
+
+        queue_depth = self.waiting
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        return Slot(self, time.monotonic() - start, queue_depth)
+
+    def _release(self, held):
+        self.in_flight -= 1
+        if self.service_time is None:
+            self.service_time = held
+        else:
+            self.service_time = 0.8 * self.service_time + 0.2 * held
+        self.semaphore.release()
+
+
+class Flight:
+    """One in-progress generation that any number of requests can follow.
+
+    Tokens are kept as they arrive, so a follower that joins late first replays
+    what it missed and then continues live.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+
+    async def publish(self, token):
+        async with self.changed:
+            self.tokens.append(token)
+            self.changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self.changed:
+            self.done = True
+            self.error = error
+            self.changed.notify_all()
+
+    async def subscribe(self):
+        seen = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.tokens) > seen or self.done)
+                new_tokens = self.tokens[seen:]
+                done = self.done
+
+            for token in new_tokens:
+                yield token
+            seen += len(new_tokens)
+
+            if done and seen >= len(self.tokens):
+                if self.error:
+                    raise self.error
+                return
+
+    async def result(self):
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.done)
+        if self.error:
+            raise self.error
+        return "".join(self.tokens)
+
+
+class SingleFlight:
+    """Coalesces concurrent identical work: one producer run per key, shared by every caller.
+
+    The producer runs as its own task, so it finishes (and fills the answer
+    cache) even if the request that started it disconnects.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.tasks = set()
+
+    def get(self, key):
+        return self.flights.get(key)
+
+    def start(self, key, producer):
+        flight = self.flights[key] = Flight()
+        task = asyncio.create_task(self._run(key, flight, producer))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return flight
+
+    async def _run(self, key, flight, producer):
+        error = None
+        try:
+            async for token in producer:
+                await flight.publish(token)
+        except asyncio.CancelledError:
+            # Shutdown or an explicit cancel: close the producer (releasing its slot) and
+            # fail the followers rather than leave them waiting on a flight that never ends
+            error = FlightCancelled()
+            await producer.aclose()
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            self.flights.pop(key, None)
+            await flight.finish(error)
@@ -0,0 +1,180 @@
+import os
+import re
+
+from langchain_core.documents import Document
+
+from metrics import CONTEXT_CHARS, CONTEXT_TOKENS, current_timings, timed
+
+# Optional cap on context tokens per prompt; 0 means none, only merging and de-duplication.
+# Prompt processing on CPU llama3 scales with context, so a cap buys latency, but it cuts
+# unique text: top-6 chunks of 1000 characters are already ~1500 tokens before merging
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# Share of a chunk's word shingles already present in the context above which it is dropped
+DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+
+# No llama3 tokenizer in the API process; ~4 characters per token holds for English and Norwegian prose
+CHARS_PER_TOKEN = 4
+# Longest overlap the splitter produces (chunk_overlap=200) plus slack for whitespace it strips
+MAX_OVERLAP = 250
+MIN_OVERLAP = 20
+SHINGLE_SIZE = 5
+# A chunk that would be cut below this many tokens is left out instead
+MIN_PIECE_TOKENS = 48
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def merge_text(a, b):
+    """`a` and `b` joined if one continues the other, else None."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    for length in range(min(len(a), len(b), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:length]):
+            return a + b[length:]
+        if b.endswith(a[:length]):
+            return b + a[length:]
+    return None
+
+
+def merge_positioned(a, b):
+    # Chunks ingested with add_start_index know exactly where they sit in the page
+    first, second = sorted((a, b), key=lambda piece: piece["start"])
+    end = first["start"] + len(first["text"])
+    if second["start"] > end + 2:
+        return None
+    if second["start"] >= end:
+        return first["text"] + " " + second["text"]
+    return first["text"] + second["text"][end - second["start"]:]
+
+
+def merge_source(pieces):
+    """Repeatedly merges overlapping or adjacent chunks of one page. Returns (pieces, merges)."""
+    merges = 0
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(pieces)):
+            for j in range(i + 1, len(pieces)):
+                a, b = pieces[i], pieces[j]
+                if a["start"] is not None and b["start"] is not None:
+                    text = merge_positioned(a, b)
+                else:
+                    text = merge_text(a["text"], b["text"])
+                if text is None:
+                    continue
+                starts = [p["start"] for p in (a, b) if p["start"] is not None]
+                pieces[i] = {
+                    "text": text,
+                    "rank": min(a["rank"], b["rank"]),
+                    "start": min(starts) if len(starts) == 2 else None,
+                    "metadata": a["metadata"] if a["rank"] < b["rank"] else b["metadata"],
+                    "chunks": a["chunks"] + b["chunks"],
+                }
+                del pieces[j]
+                merges += 1
+                merged = True
+                break
+            if merged:
+                break
+    return pieces, merges
+
+
+def truncate(text, max_chars):
+    # Cut at the last sentence end that fits, falling back to the last word boundary
+    cut = text[:max_chars]
+    for boundary in (". ", "\n", " "):
+        position = cut.rfind(boundary)
+        if position > max_chars // 2:
+            return cut[:position + 1].rstrip()
+    return cut
+
+
+def assemble_context(docs, token_budget=TOKEN_BUDGET, duplicate_threshold=DUPLICATE_THRESHOLD):
+    """Turns ranked retriever hits into the documents actually stuffed into the prompt.
+
+    Chunks from the same page that overlap or touch are merged into one passage,
+    passages mostly repeating text already selected are dropped, and with a token
+    budget (0 = none) passages are taken in rank order until it is spent.
+    Returns (documents, stats).
+    """
+    by_source = {}
+    for rank, doc in enumerate(docs):
+        source = doc.metadata.get("source", f"unknown-{rank}")
+        by_source.setdefault(source, []).append({
+            "text": doc.page_content,
+            "rank": rank,
+            "start": doc.metadata.get("start_index"),
+            "metadata": doc.metadata,
+            "chunks": 1,
+        })
+
+    pieces = []
+    merges = 0
+    for source_pieces in by_source.values():
+        source_pieces, source_merges = merge_source(source_pieces)
+        pieces.extend(source_pieces)
+        merges += source_merges
+    pieces.sort(key=lambda piece: piece["rank"])
+
+    selected = []
+    seen = set()
+    used = 0
+    duplicates = 0
+    truncated = 0
+    for piece in pieces:
+        piece_shingles = shingles(piece["text"])
+        if seen and len(piece_shingles & seen) / len(piece_shingles) >= duplicate_threshold:
+            duplicates += 1
+            continue
+
+        text = piece["text"]
+        remaining = token_budget - used
+        if token_budget and estimate_tokens(text) > remaining:
+            if selected and remaining < MIN_PIECE_TOKENS:
+                continue
+            text = truncate(text, remaining * CHARS_PER_TOKEN)
+            truncated += 1
+
+        selected.append(Document(page_content=text, metadata=dict(piece["metadata"], merged_chunks=piece["chunks"])))
+        seen |= piece_shingles
+        used += estimate_tokens(text)
+
+    retrieved_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+    stats = {
+        "retrieved_docs": len(docs),
+        "retrieved_tokens": retrieved_tokens,
+        "context_docs": len(selected),
+        "context_tokens": used,
+        "context_chars": sum(len(doc.page_content) for doc in selected),
+        "merged_chunks": merges,
+        "duplicates_dropped": duplicates,
+        "truncated": truncated,
+        "context_reduction_pct": round(100 * (1 - used / retrieved_tokens), 1) if retrieved_tokens else 0.0,
+    }
+    return selected, stats
+
+
+def assemble_and_report(docs):
+    """assemble_context as a chain step: records the "assemble" stage and per-request sizes."""
+    with timed("assemble"):
+        selected, stats = assemble_context(docs)
+
+    CONTEXT_CHARS.observe(stats["context_chars"])
+    CONTEXT_TOKENS.observe(stats["retrieved_tokens"], kind="retrieved")
+    CONTEXT_TOKENS.observe(stats["context_tokens"], kind="assembled")
+    timings = current_timings.get()
+    if timings is not None:
+        for key, value in stats.items():
+            timings.set(key, value)
+    return selected
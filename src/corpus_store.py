@@ -0,0 +1,201 @@
+import gzip
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+
+from crawl_state import content_hash, url_key
+
+# Every record is its own gzip member holding one JSON line, so the whole file
+# is also a valid .jsonl.gz (zcat data/corpus.jsonl.gz | head) and can be copied as one artefact
+CORPUS_PATH = "data/corpus.jsonl.gz"
+# Same format; "text" holds the page HTML as fetched, so extraction can be redone offline
+RAW_HTML_PATH = "data/raw_html.jsonl.gz"
+INDEX_SUFFIX = ".idx"
+
+COMPRESS_LEVEL = 6
+# Bytes handed to zlib at a time when rebuilding the index from the data file
+SCAN_FEED = 1 << 16
+
+
+class CorpusStore:
+    """Append-only page corpus: gzip-compressed JSON records plus an offset index.
+
+    A record is {"id", "url", "fetched_at", "content_hash", "text", ...}; its id
+    is url_key(url). Writing a URL again appends a new record that supersedes
+    the old one, and delete() appends a tombstone, so nothing is rewritten in
+    place; compact() drops superseded records. The index ("id offset length
+    live" per line) is appended after each record and rebuilt from the data
+    file if a crash left it behind.
+    """
+
+    def __init__(self, path=CORPUS_PATH):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.data = None
+        self.index = None
+        self.reader = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._load_index()
+
+    # -- index ---------------------------------------------------------------
+
+    def _load_index(self):
+        end = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 4:
+                        break
+                    record_id, offset, length, live = parts[0], int(parts[1]), int(parts[2]), parts[3] == "1"
+                    self._apply(record_id, offset, length, live)
+                    end = max(end, offset + length)
+
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size != end:
+            self._recover(end, size)
+
+    def _apply(self, record_id, offset, length, live):
+        if live:
+            self.entries[record_id] = (offset, length)
+        else:
+            self.entries.pop(record_id, None)
+
+    def _recover(self, start, size):
+        # Records past `start` have no index lines (crash, or no index yet): rescan that tail
+        end = start
+        for record, offset, length in scan_members(self.path, start):
+            self._apply(record["id"], offset, length, not record.get("deleted"))
+            end = offset + length
+        if end < size:
+            # A torn write at the very end; drop it so the next append starts clean
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+
+        tmp = f"{self.index_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as index:
+            for record_id, (offset, length) in sorted(self.entries.items(), key=lambda item: item[1]):
+                index.write(f"{record_id} {offset} {length} 1\n")
+        os.replace(tmp, self.index_path)
+
+    # -- writing -------------------------------------------------------------
+
+    def _append(self, record):
+        blob = gzip.compress((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"), COMPRESS_LEVEL, mtime=0)
+        with self.lock:
+            if self.data is None:
+                self.data = open(self.path, "ab")
+                self.index = open(self.index_path, "a", encoding="utf-8")
+            offset = self.data.seek(0, os.SEEK_END)
+            self.data.write(blob)
+            self.data.flush()
+            live = not record.get("deleted")
+            self.index.write(f"{record['id']} {offset} {len(blob)} {int(live)}\n")
+            self.index.flush()
+            self._apply(record["id"], offset, len(blob), live)
+        return record["id"]
+
+    def put(self, url, text, fetched_at=None, digest=None, **extra):
+        record = {
+            "id": url_key(url),
+            "url": url,
+            "fetched_at": int(fetched_at or time.time()),
+            "content_hash": digest or content_hash(text),
+            "text": text,
+            **extra,
+        }
+        return self._append(record)
+
+    def delete(self, record_id, **extra):
+        if record_id in self.entries:
+            self._append({"id": record_id, "deleted": True, **extra})
+
+    def close(self):
+        with self.lock:
+            for handle in (self.data, self.index, self.reader):
+                if handle is not None:
+                    handle.close()
+            self.data = self.index = self.reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def compact(self):
+        """Rewrites only the live records, in their current order, and swaps the files in."""
+        for leftover in (self.path + ".compact", self.path + ".compact" + INDEX_SUFFIX):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        tmp = CorpusStore(self.path + ".compact")
+        for record in self.iter_records():
+            tmp._append(record)
+        tmp.close()
+        self.close()
+        os.replace(tmp.path, self.path)
+        os.replace(tmp.index_path, self.index_path)
+        self.entries = tmp.entries
+
+    # -- reading -------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, record_id):
+        return record_id in self.entries
+
+    def ids(self):
+        return list(self.entries)
+
+    def get(self, record_id):
+        entry = self.entries.get(record_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        with self.lock:
+            if self.reader is None:
+                self.reader = open(self.path, "rb")
+            self.reader.seek(offset)
+            blob = self.reader.read(length)
+        return json.loads(gzip.decompress(blob))
+
+    def get_url(self, url):
+        return self.get(url_key(url))
+
+    def iter_records(self):
+        """Streams the live records in file order."""
+        with open(self.path, "rb") as f:
+            for offset, length in sorted(self.entries.values()):
+                f.seek(offset)
+                yield json.loads(gzip.decompress(f.read(length)))
+
+
+def scan_members(path, start):
+    """Yields (record, offset, length) for each complete gzip member from `start` on."""
+    if not os.path.exists(path) or os.path.getsize(path) <= start:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = start
+        while position < len(data):
+            decoder = zlib.decompressobj(wbits=31)
+            parts = []
+            fed = position
+            # Small feeds so unused_data (copied by zlib) stays small
+            while not decoder.eof and fed < len(data):
+                piece = data[fed:fed + SCAN_FEED]
+                fed += len(piece)
+                try:
+                    parts.append(decoder.decompress(piece))
+                except zlib.error:
+                    return
+            if not decoder.eof:
+                return
+            length = fed - len(decoder.unused_data) - position
+            yield json.loads(b"".join(parts)), position, length
+            position += length
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+STATE_FILE = "data/crawl_state.json"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def url_key(url):
+    # Stable file key: independent of where the URL sits in safe_urls.json
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+
+
+class CrawlState:
+    """Per-URL crawl record: ETag, Last-Modified, sitemap <lastmod>, content hash and drop reason.
+
+    Stored as one JSON object keyed by URL. Thread-safe so fetch and parse
+    workers can update it concurrently; `save()` writes atomically.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, url):
+        with self.lock:
+            return dict(self.entries.get(url, {}))
+
+    def update(self, url, **fields):
+        with self.lock:
+            entry = self.entries.setdefault(url, {})
+            entry.update({k: v for k, v in fields.items() if v is not None})
+            entry["checked_at"] = int(time.time())
+
+    def mark_dropped(self, url, reason):
+        # Set by clean_data.py: the page was removed on purpose and must not be written back
+        # until its content changes upstream
+        with self.lock:
+            self.entries.setdefault(url, {})["dropped"] = reason
+
+    def clear_dropped(self, url):
+        with self.lock:
+            self.entries.get(url, {}).pop("dropped", None)
+
+    def conditional_headers(self, url):
+        entry = self.get(url)
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp, self.path)
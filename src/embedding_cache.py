@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite")
+MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# sqlite caps bound parameters per statement; stay well below it
+QUERY_BATCH = 500
+# Evict at most this often (per process) instead of counting rows on every insert
+EVICT_EVERY = 1000
+# A hit refreshes last_used only if it is older than this (seconds). LRU order is then
+# approximate to within the interval, but most reads stay reads and never take SQLite's write lock
+TOUCH_INTERVAL = 3600
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Disk-backed vector cache keyed by (model, sha256(text)) with LRU eviction.
+
+    SQLite in WAL mode, so several uvicorn workers and an ingest run can read
+    and write the same file at once.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.inserts_since_evict = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection()
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+            self.local.conn = conn
+        return conn
+
+    def get_many(self, model, keys):
+        conn = self.connection()
+        found = {}
+        stale = []
+        now = time.time()
+        for start in range(0, len(keys), QUERY_BATCH):
+            batch = keys[start:start + QUERY_BATCH]
+            marks = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector, last_used FROM embeddings WHERE model = ? AND key IN ({marks})", [model, *batch]
+            ).fetchall()
+            for key, blob, last_used in rows:
+                found[key] = array("f", blob).tolist()
+                if now - last_used > TOUCH_INTERVAL:
+                    stale.append((now, model, key))
+        if stale:
+            conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?", stale)
+            conn.commit()
+
+        with self.lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model, items):
+        conn = self.connection()
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(model, key, array("f", vector).tobytes(), now) for key, vector in items],
+        )
+        conn.commit()
+
+        with self.lock:
+            self.inserts_since_evict += len(items)
+            due = self.inserts_since_evict >= EVICT_EVERY
+            if due:
+                self.inserts_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        conn = self.connection()
+        (count,) = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            conn.commit()
+        return max(excess, 0)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps any LangChain embedding model; only cache misses reach the provider."""
+
+    def __init__(self, embeddings, cache=None, model_name=None):
+        self.embeddings = embeddings
+        self.cache = cache or EmbeddingCache()
+        self.model_name = model_name or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    def embed_documents(self, texts):
+        keys = [text_key(text) for text in texts]
+        found = self.cache.get_many(self.model_name, list(dict.fromkeys(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self.cache.put_many(self.model_name, computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text):
+        key = text_key(text)
+        found = self.cache.get_many(self.model_name, [key])
+        if key in found:
+            return found[key]
+
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model_name, [(key, vector)])
+        return vector
+
+    def stats(self):
+        return self.cache.stats()
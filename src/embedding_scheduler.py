@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+BATCH_SIZE = 100
+INITIAL_CONCURRENCY = 2
+MAX_CONCURRENCY = 8
+MAX_ATTEMPTS = 8
+# Backoff for a failed batch without Retry-After: BASE * 2^attempt, capped, with full jitter
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight requests: +1 per window of successes, halved on throttling.
+
+    A 429 or 5xx also pauses every new request until its Retry-After has
+    passed, so the whole pool backs off together instead of hammering the
+    provider one thread at a time. Other failures (a 400 for one bad batch,
+    a 401) say nothing about load and leave the limit alone.
+    """
+
+    def __init__(self, initial=INITIAL_CONCURRENCY, maximum=MAX_CONCURRENCY):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.active = 0
+        self.peak = 0
+        self.paused_until = 0.0
+        self.changed = threading.Condition()
+
+    def acquire(self):
+        with self.changed:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.changed.wait(pause)
+                elif self.active >= int(self.limit):
+                    self.changed.wait()
+                else:
+                    break
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def release(self, ok, retry_after=0.0, throttled=True):
+        with self.changed:
+            self.active -= 1
+            if ok:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif throttled:
+                self.limit = max(1.0, self.limit / 2)
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self.changed.notify_all()
+
+
+def error_status(error):
+    """HTTP status of a provider error (openai.APIStatusError, httpx/requests errors), else None."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+
+def is_retryable(error):
+    status = error_status(error)
+    if status is None:
+        # Connection resets and timeouts carry no status
+        name = type(error).__name__
+        return isinstance(error, (ConnectionError, TimeoutError)) or "Connection" in name or "Timeout" in name
+    return status in RETRYABLE_STATUS
+
+
+class ParallelEmbeddings(Embeddings):
+    """Splits embed_documents into batches and runs them concurrently under AdaptiveConcurrency.
+
+    Wrap it around CachedEmbeddings so each finished batch is written to the
+    embedding cache as soon as it lands: that cache is the checkpoint, and an
+    interrupted ingest only re-sends the batches that never completed. The
+    wrapped client should not retry on its own (e.g. OpenAIEmbeddings with
+    max_retries=0 and chunk_size=BATCH_SIZE), or its retries hide the
+    throttling this class reacts to.
+    """
+
+    def __init__(self, embeddings, batch_size=BATCH_SIZE, initial_concurrency=INITIAL_CONCURRENCY,
+                 max_concurrency=MAX_CONCURRENCY, max_attempts=MAX_ATTEMPTS):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.limiter = AdaptiveConcurrency(initial_concurrency, max_concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self.lock = threading.Lock()
+        self.counts = {"batches": 0, "texts": 0, "retries": 0, "rate_limited": 0, "server_errors": 0}
+
+    def _count(self, **amounts):
+        with self.lock:
+            for key, amount in amounts.items():
+                self.counts[key] += amount
+
+    def _embed_batch(self, texts):
+        for attempt in range(self.max_attempts):
+            self.limiter.acquire()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                throttled = is_retryable(e)
+                retryable = throttled and attempt < self.max_attempts - 1
+                wait = retry_after(e) or random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                self.limiter.release(ok=False, retry_after=wait if retryable else 0.0, throttled=throttled)
+                if not retryable:
+                    raise
+                status = error_status(e)
+                self._count(retries=1, rate_limited=int(status == 429), server_errors=int(status != 429))
+                continue
+            self.limiter.release(ok=True)
+            self._count(batches=1, texts=len(texts))
+            return vectors
+
+    def embed_documents(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        futures = [self.pool.submit(self._embed_batch, batch) for batch in batches]
+        return [vector for future in futures for vector in future.result()]
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+        counts["concurrency_limit"] = int(self.limiter.limit)
+        counts["peak_concurrency"] = self.limiter.peak
+        return counts
@@ -0,0 +1,159 @@
+import os
+import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from bs4 import BeautifulSoup, UnicodeDammit
+
+from corpus_store import CORPUS_PATH, RAW_HTML_PATH, CorpusStore
+from crawl_state import STATE_FILE, CrawlState, content_hash
+
+JUNK_TAGS = ["script", "style", "nav", "footer", "header", "form", "noscript", "aside"]
+
+# html.parser is what every stored page was extracted with so far; lxml and selectolax
+# give the same text several times faster but are optional installs
+PARSER = "html.parser"
+PARSERS = ("html.parser", "lxml", "selectolax")
+
+# lxml refuses a str that still carries <?xml ... encoding="..."?>; the text is already decoded, so it goes
+XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+# Pages handed to the process pool at a time, so the archive is never all in memory
+POOL_WINDOW = 512
+
+
+def extract_bs4(html):
+    soup = BeautifulSoup(html, "html.parser")
+
+    for junk in soup(JUNK_TAGS):
+        junk.decompose()
+
+    content_div = soup.find('div', class_='main-content') or soup.find('main') or soup.body
+
+    if content_div:
+        return content_div.get_text(separator=' ', strip=True)
+    return ""
+
+
+def extract_lxml(html):
+    import lxml.html
+
+    if not html.strip():
+        return ""
+    root = lxml.html.fromstring(XML_DECLARATION.sub("", html, count=1))
+
+    for junk in list(root.iter(*JUNK_TAGS)):
+        junk.drop_tree()
+
+    matches = root.xpath('//div[contains(concat(" ", normalize-space(@class), " "), " main-content ")]')
+    content_div = matches[0] if matches else root.find(".//main")
+    if content_div is None:
+        content_div = root.find(".//body")
+
+    if content_div is not None:
+        return " ".join(s for s in (piece.strip() for piece in content_div.itertext()) if s)
+    return ""
+
+
+def extract_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(JUNK_TAGS)
+
+    content_div = tree.css_first("div.main-content") or tree.css_first("main") or tree.body
+
+    if content_div:
+        # node.text(strip=True) keeps the separators of whitespace-only nodes; match get_text instead
+        pieces = (node.text_content.strip() for node in content_div.traverse(include_text=True) if node.tag == "-text")
+        return " ".join(s for s in pieces if s)
+    return ""
+
+
+def decode_html(content):
+    # The bytes decoded the way BeautifulSoup always did (meta charset, then sniffing), kept as str in the archive
+    return UnicodeDammit(content, is_html=True).unicode_markup or ""
+
+
+BACKENDS = {"html.parser": extract_bs4, "lxml": extract_lxml, "selectolax": extract_selectolax}
+
+
+def extract_text(html, parser=PARSER):
+    # Module-level so it can run in a process pool
+    return BACKENDS[parser](html)
+
+
+def available_parsers():
+    found = []
+    for parser in PARSERS:
+        try:
+            extract_text("<html><body><p>ok</p></body></html>", parser)
+        except ImportError:
+            continue
+        found.append(parser)
+    return found
+
+
+def extract_corpus(raw_path=RAW_HTML_PATH, corpus_path=CORPUS_PATH, parser=PARSER, workers=None,
+                   state_file=STATE_FILE):
+    """Re-derives page text from the raw HTML archive; no network involved.
+
+    Only pages whose text actually changed are rewritten, so a re-extraction
+    with the same rules leaves the corpus (and the next ingest) untouched.
+    Pages clean_data.py dropped stay out of the corpus.
+    """
+    if not os.path.exists(raw_path):
+        print(f" Error: Raw HTML archive '{raw_path}' not found. Run 2_scrape_data.py first.")
+        return
+    if parser not in available_parsers():
+        print(f" Error: parser '{parser}' is not installed (available: {', '.join(available_parsers())}).")
+        return
+
+    raw = CorpusStore(raw_path)
+    state = CrawlState(state_file)
+    print(f"Extracting {len(raw)} pages from '{raw_path}' with {parser}...")
+
+    counts = {"changed": 0, "unchanged": 0, "dropped": 0, "failed": 0}
+    with CorpusStore(corpus_path) as store, ProcessPoolExecutor(max_workers=workers) as pool:
+        records = raw.iter_records()
+        while True:
+            window = list(islice(records, POOL_WINDOW))
+            if not window:
+                break
+            # Removed on purpose by clean_data.py; re-extracting would only put them back
+            live = [record for record in window if not state.get(record["url"]).get("dropped")]
+            counts["dropped"] += len(window) - len(live)
+            window = live
+            futures = [pool.submit(extract_text, record["text"], parser) for record in window]
+            for record, future in zip(window, futures):
+                try:
+                    text = future.result()
+                except Exception as e:
+                    counts["failed"] += 1
+                    print(f"  Failed to extract {record['url']}: {e}")
+                    continue
+
+                digest = content_hash(text)
+                current = store.get(record["id"])
+                if current is not None and current["content_hash"] == digest:
+                    counts["unchanged"] += 1
+                    continue
+                store.put(record["url"], text, fetched_at=record["fetched_at"], digest=digest)
+                counts["changed"] += 1
+
+    print("-" * 30)
+    print(" Extraction Complete!")
+    print(f"    Changed:   {counts['changed']}")
+    print(f"    Unchanged: {counts['unchanged']}")
+    print(f"    Dropped by clean_data.py, skipped: {counts['dropped']}")
+    print(f"    Failed:    {counts['failed']}")
+    print("-" * 30)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-extract page text from the raw HTML archive.")
+    parser.add_argument("--parser", choices=PARSERS, default=PARSER, help=f"HTML parser backend (default: {PARSER})")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default: one per CPU)")
+    args = parser.parse_args()
+    extract_corpus(parser=args.parser, workers=args.workers)
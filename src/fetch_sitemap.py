@@ -1,54 +1,133 @@
-import requests
-import xml.etree.ElementTree as ET
+import gzip
 import json
 import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
 
 URL = "https://www.udi.no/sitemap.xml"
-headers = {'User-Agent': 'MyStudentProject/1.0'}
-r = requests.get(url = URL, headers = headers)
-
-if r.status_code == 200:
-    print(f' {URL} was found')
-    root = ET.fromstring(r.content)
-    print(f"XML Parsed successfully. Root tag is: {root.tag}")
-else:
-    print(f' {URL} was NOT found')
-
-print( type(root))
-print(f"📦 Number of items found: {len(root)}")
-
-if len(root) > 0:
-    first_child = root[1]
-    print(f" First Child Tag: {first_child.tag}")
-
-    for grandchild in first_child:
-        print(f"  grand: {grandchild.tag}: {grandchild.text}")
-
-
-namespaces = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'} #as url is long we call it with ns 
-output_file = "data/safe_urls.json"
-safe_urls = []
-for i, child in enumerate(root):
-    loc_tag = child.find('ns:loc', namespaces)
-    
-    if loc_tag is not None:
-        url = loc_tag.text
-        if "/Util/" in url:
-            continue 
-            
-        if url.endswith((".pdf", ".jpg", ".png", ".docx")):
-            continue   
-        safe_urls.append(url)
-    # Ensure the data folder exists
-    os.makedirs("data", exist_ok=True)
+OUTPUT_FILE = "data/safe_urls.json"
+HEADERS = {'User-Agent': 'MyStudentProject/1.0'}
+
+MAX_WORKERS = 4
+REQUEST_TIMEOUT = 60
+SKIP_EXTENSIONS = (".pdf", ".jpg", ".png", ".docx")
+
+
+def local_name(tag):
+    # "{http://www.sitemaps.org/schemas/sitemap/0.9}loc" -> "loc" (also works without a namespace)
+    return tag.rsplit("}", 1)[-1]
+
+
+def is_safe(url):
+    if "/Util/" in url:
+        return False
+    return not url.endswith(SKIP_EXTENSIONS)
+
+
+def parse_priority(value):
+    # One malformed <priority> must not throw away the rest of the sitemap
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_sitemap(stream):
+    """Stream-parse one sitemap or sitemap index.
+
+    Returns (entries, child_sitemaps). Each finished <url>/<sitemap> element is
+    read and then dropped from the root, so memory stays flat however many
+    entries the sitemap has.
+    """
+    entries = []
+    children = []
+    root = None
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+
+        tag = local_name(elem.tag)
+        if tag not in ("url", "sitemap"):
+            continue
+
+        fields = {local_name(child.tag): (child.text or "").strip() for child in elem}
+        loc = fields.get("loc")
 
+        if loc and tag == "sitemap":
+            children.append(loc)
+        elif loc and is_safe(loc):
+            entries.append({
+                "loc": loc,
+                "lastmod": fields.get("lastmod") or None,
+                "priority": parse_priority(fields.get("priority")),
+            })
+
+        # Entries are direct children of <urlset>/<sitemapindex>: clearing the root drops this one
+        root.clear()
+
+    return entries, children
+
+
+def fetch_one(session, url):
+    with session.get(url, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        stream = response.raw
+        if url.endswith(".gz"):
+            stream = gzip.GzipFile(fileobj=stream)
+        return parse_sitemap(stream)
+
+
+def fetch_and_save_sitemap(url=URL, output_file=OUTPUT_FILE, max_workers=MAX_WORKERS):
+    session = requests.Session()
+    session.headers.update(HEADERS)
+
+    seen_sitemaps = {url}
+    frontier = [url]
+    urls = {}
+    raw_count = 0
+
+    # Breadth-first over <sitemapindex> levels; the children of each level are fetched concurrently
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while frontier:
+            next_frontier = []
+            futures = {sitemap: pool.submit(fetch_one, session, sitemap) for sitemap in frontier}
+
+            for sitemap, future in futures.items():
+                try:
+                    entries, children = future.result()
+                except Exception as e:
+                    print(f" {sitemap} could not be read: {e}")
+                    continue
+
+                print(f" {sitemap}: {len(entries)} pages, {len(children)} child sitemaps")
+                raw_count += len(entries)
+                for entry in entries:
+                    urls.setdefault(entry["loc"], entry)
+                for child in children:
+                    if child not in seen_sitemaps:
+                        seen_sitemaps.add(child)
+                        next_frontier.append(child)
+
+            frontier = next_frontier
+
+    session.close()
+    safe_urls = list(urls.values())
+
+    os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+    # One URL object per line: diff-friendly, and far faster than indent=2 for 100k+ entries
     with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(safe_urls, f, indent=2)
-print(f" Success. Processed {len(root)} raw items.")
-print(f"Saved {len(safe_urls)} safe URLs to '{output_file}'.")
+        f.write("[\n" + ",\n".join(json.dumps(entry) for entry in safe_urls) + "\n]\n")
 
-if __name__ == "__main__":
-    fetch_and_save_sitemap()
-    
+    print(f" Success. Read {len(seen_sitemaps)} sitemaps, {raw_count} safe entries.")
+    print(f"Saved {len(safe_urls)} safe URLs to '{output_file}'.")
+    return safe_urls
 
 
+if __name__ == "__main__":
+    fetch_and_save_sitemap()
@@ -0,0 +1,243 @@
+import json
+import math
+import os
+import re
+import shutil
+import threading
+from array import array
+from collections import Counter
+from typing import Any
+
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+
+from metrics import timed
+from vector_index import RecordReader, RecordWriter, swap_directory
+
+ROWS_FILE = "rows.npy"
+TFS_FILE = "tfs.npy"
+LENGTHS_FILE = "lengths.npy"
+VOCAB_FILE = "vocab.json"
+SPILL_FILE = "postings.tmp"
+
+# Postings re-sorted per pass when the index is finalised; bounds memory at close
+MERGE_BLOCK = 262_144
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+# Keyword queries this short that appear verbatim in k chunks skip the embedding call entirely
+FAST_PATH_MAX_TOKENS = 4
+
+TOKEN_RE = re.compile(r"\w+(?:-\w+)*")
+# What makes a query a keyword lookup: a digit, a hyphenated term or an upper-case code ("UDI-0042", "D-number", "EEA")
+KEYWORD_RE = re.compile(r"\d|\w-\w|\b[A-Z]{2,}\b")
+
+
+def tokenize(text):
+    # "D-number" indexes as "d-number", "d" and "number", so either spelling matches
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if "-" in token:
+            tokens.extend(token.split("-"))
+    return tokens
+
+
+class LexicalIndexBuilder:
+    """Accumulates term frequencies chunk by chunk and writes a compact BM25 index.
+
+    Postings are spilled to disk as (term, row, tf) int32 triples while
+    building, then placed into term order block by block, so memory does not
+    grow with the corpus beyond the vocabulary. On disk: the vocabulary
+    (term -> [df, start]) as JSON, and the posting lists concatenated into two
+    int32 arrays (chunk row, term frequency) that the API memory-maps.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+        self.records = RecordWriter(self.tmp_path)
+        self.spill = open(os.path.join(self.tmp_path, SPILL_FILE), "wb")
+        self.terms = {}
+        self.lengths = array("i")
+
+    def add(self, chunk_id, text, metadata):
+        row = len(self.lengths)
+        tokens = tokenize(text)
+        triples = array("i")
+        for term, tf in Counter(tokens).items():
+            triples.extend((self.terms.setdefault(term, len(self.terms)), row, tf))
+        triples.tofile(self.spill)
+        self.lengths.append(len(tokens))
+        self.records.add(chunk_id, text, metadata)
+
+    def close(self):
+        self.records.close()
+        self.spill.close()
+        spill_path = os.path.join(self.tmp_path, SPILL_FILE)
+        count = os.path.getsize(spill_path) // 12
+        if count:
+            triples = np.memmap(spill_path, dtype=np.int32, mode="r", shape=(count, 3))
+        else:
+            triples = np.empty((0, 3), dtype=np.int32)
+
+        dfs = np.zeros(len(self.terms), dtype=np.int64)
+        for start in range(0, count, MERGE_BLOCK):
+            dfs += np.bincount(triples[start:start + MERGE_BLOCK, 0], minlength=len(self.terms))
+        starts = np.cumsum(dfs) - dfs
+
+        rows = np.lib.format.open_memmap(os.path.join(self.tmp_path, ROWS_FILE), mode="w+", dtype=np.int32, shape=(count,))
+        tfs = np.lib.format.open_memmap(os.path.join(self.tmp_path, TFS_FILE), mode="w+", dtype=np.int32, shape=(count,))
+        # Blocks go in row order and the sort is stable, so every posting list ends up in row order
+        cursor = starts.copy()
+        for start in range(0, count, MERGE_BLOCK):
+            block = np.asarray(triples[start:start + MERGE_BLOCK])
+            block = block[np.argsort(block[:, 0], kind="stable")]
+            terms, first, counts = np.unique(block[:, 0], return_index=True, return_counts=True)
+            positions = cursor[block[:, 0]] + np.arange(len(block)) - np.repeat(first, counts)
+            rows[positions] = block[:, 1]
+            tfs[positions] = block[:, 2]
+            cursor[terms] += counts
+        rows.flush()
+        tfs.flush()
+        del rows, tfs, triples
+        os.remove(spill_path)
+
+        np.save(os.path.join(self.tmp_path, LENGTHS_FILE), np.frombuffer(self.lengths, dtype=np.int32))
+        vocab = {term: [int(dfs[i]), int(starts[i])] for term, i in self.terms.items()}
+        with open(os.path.join(self.tmp_path, VOCAB_FILE), "w", encoding="utf-8") as f:
+            json.dump(vocab, f, ensure_ascii=False, separators=(",", ":"))
+        swap_directory(self.tmp_path, self.path)
+        return len(self.lengths)
+
+
+class LexicalState:
+    """One loaded version of the index; replaced as a whole when 3_ingest.py swaps in a new one."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, VOCAB_FILE), "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        self.rows = np.load(os.path.join(path, ROWS_FILE), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, TFS_FILE), mmap_mode="r")
+        self.lengths = np.load(os.path.join(path, LENGTHS_FILE)).astype(np.float32)
+        self.avg_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+        self.records = RecordReader(path)
+
+
+class LexicalIndex:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.signature = None
+        self.state = None
+        self.reload_if_changed()
+        if self.state is None:
+            raise FileNotFoundError(f"No lexical index at {path}. Run 3_ingest.py first.")
+
+    def reload_if_changed(self):
+        # Same scheme as FlatIndex: every ingest swaps in a new directory, so the inode changes
+        try:
+            stat = os.stat(os.path.join(self.path, VOCAB_FILE))
+        except FileNotFoundError:
+            # Mid-swap by a running ingest: keep serving the index we have
+            return
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if signature == self.signature:
+            return
+
+        with self.lock:
+            if signature == self.signature:
+                return
+            try:
+                state = LexicalState(self.path)
+            except FileNotFoundError:
+                return
+            self.state = state
+            self.signature = signature
+
+    def search(self, query, k, state=None):
+        """BM25 top-k as [(row, score)]."""
+        state = state or self.state
+        n = len(state.lengths)
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in state.vocab:
+                continue
+            df, start = state.vocab[term]
+            rows = state.rows[start:start + df]
+            tfs = state.tfs[start:start + df].astype(np.float32)
+            idf = math.log((n - df + 0.5) / (df + 0.5) + 1)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * state.lengths[rows] / state.avg_length)
+            scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        top = matched[np.argsort(-scores[matched])[:k]]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def documents(self, query, k):
+        # Postings and chunk text from the same version, even if a reload lands meanwhile
+        state = self.state
+        return [state.records.document(row, bm25=score) for row, score in self.search(query, k, state)]
+
+
+def is_keyword_query(query):
+    # "can I work" or "family permit" are questions and go through the vector side too
+    return 0 < len(tokenize(query)) <= FAST_PATH_MAX_TOKENS and KEYWORD_RE.search(query) is not None
+
+
+def doc_key(doc):
+    return doc.metadata.get("chunk_id") or doc.id or doc.page_content
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=RRF_K):
+    """Fuses ranked Document lists by sum of 1 / (rrf_k + rank), keyed on chunk id."""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            docs.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 + vector retrieval fused with RRF.
+
+    `vector_retriever` should return `fetch_k` candidates. Short keyword
+    queries (permit codes, form names, "D-number") put the chunks containing
+    them verbatim first; only if there are `k` of those is the vector side
+    skipped, otherwise the rest comes from the fused ranking.
+    """
+
+    lexical: Any
+    vector_retriever: Any
+    k: int = 6
+    fetch_k: int = 20
+    fast_path: bool = True
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        # Pick up a re-ingest, like FlatIndex does for the vector side
+        self.lexical.reload_if_changed()
+        with timed("retrieve_lexical"):
+            lexical_docs = self.lexical.documents(query, self.fetch_k)
+
+        exact = []
+        if self.fast_path and is_keyword_query(query):
+            phrase = " ".join(query.lower().split()).strip(" ?!.")
+            exact = [doc for doc in lexical_docs if phrase and phrase in doc.page_content.lower()][:self.k]
+            if len(exact) == self.k:
+                return exact
+
+        callbacks = run_manager.get_child() if run_manager else None
+        vector_docs = self.vector_retriever.invoke(query, config={"callbacks": callbacks})
+        fused = reciprocal_rank_fusion([lexical_docs, vector_docs], self.k + len(exact))
+        seen = {doc_key(doc) for doc in exact}
+        return (exact + [doc for doc in fused if doc_key(doc) not in seen])[:self.k]
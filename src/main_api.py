@@ -1,51 +1,77 @@
 import os
+import json
 import time
+import asyncio
+from contextlib import asynccontextmanager
 from typing import List, Optional
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-
-from langchain_openai import OpenAIEmbeddings         
-from langchain_community.chat_models import ChatOllama 
-from langchain_community.vectorstores import Chroma
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_core.prompts import ChatPromptTemplate
+# LangChain, the OpenAI client and Chroma are imported in build_pipeline() (and stage_timing
+# in generate()), not here: importing this module stays cheap and works without a database.
+# metrics, concurrency, answer_cache and profiling must stay free of those imports
+from answer_cache import normalise_question, read_index_version
+from concurrency import AdmissionLimiter, QueueFull, SingleFlight
+import metrics
+from metrics import RequestTimings, current_timings, record_stage
+from profiling import ProfilingMiddleware, RequestProfiler
+# VECTOR_BACKEND, RETRIEVAL_MODE, RETRIEVAL_K and HYBRID_FETCH_K are read there
+from retrieval import DB_PATH, RETRIEVAL_MODE, VECTOR_BACKEND, build_retriever
 
 load_dotenv()
-app = FastAPI(title="Norwegian Immigration RAG API (Hybrid)")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-DB_PATH = "chroma_db"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# How long Ollama keeps llama3 loaded after a request; warmup plus a long keep-alive avoids cold starts
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Run one embedding, retrieval and generation before reporting ready (0 to skip)
+WARMUP = os.getenv("WARMUP", "1") != "0"
+WARMUP_QUESTION = "Do I need a residence permit to work in Norway?"
+
+
+class Pipeline:
+    """Embeddings, retriever, chain and answer cache; built once at startup by build_pipeline()."""
 
+    def __init__(self, embeddings, retriever, qa_chain, answer_cache):
+        self.embeddings = embeddings
+        self.retriever = retriever
+        self.qa_chain = qa_chain
+        self.answer_cache = answer_cache
 
-print(" Loading Vector Database.")
-if not OPENAI_API_KEY:
-    print(" Error: OPENAI_API_KEY missing.")
 
-embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY)
+def build_pipeline():
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_community.chat_models import ChatOllama
+    from langchain.chains import create_retrieval_chain
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.runnables import RunnableLambda
 
-if not os.path.exists(DB_PATH):
-    raise RuntimeError(" chromadb not found. Run 3_ingest.py first.")
+    from embedding_cache import CachedEmbeddings
+    from answer_cache import AnswerCache
+    from context_assembly import assemble_and_report
+    from stage_timing import TimedEmbeddings
 
-vector_db = Chroma(persist_directory=DB_PATH, embedding_function=embeddings)
-print("Database loaded successfully.")
+    print(" Loading Vector Database.")
+    if not OPENAI_API_KEY:
+        print(" Error: OPENAI_API_KEY missing.")
 
-print(" Connecting to Local Ollama.")
-llm = ChatOllama(model="llama3", temperature=0.0)
+    embeddings = TimedEmbeddings(CachedEmbeddings(OpenAIEmbeddings(api_key=OPENAI_API_KEY)))
 
+    if not os.path.exists(DB_PATH):
+        raise RuntimeError(" chromadb not found. Run 3_ingest.py first.")
 
-prompt = ChatPromptTemplate.from_template("""
+    retriever = build_retriever(embeddings)
+    print(f"Database loaded successfully ({VECTOR_BACKEND}, {RETRIEVAL_MODE}).")
+
+    print(" Connecting to Local Ollama.")
+    llm = ChatOllama(model="llama3", temperature=0.0, base_url=OLLAMA_BASE_URL, keep_alive=OLLAMA_KEEP_ALIVE)
+
+
+    prompt = ChatPromptTemplate.from_template("""
 Answer the following question based ONLY on the provided context.
 If you don't know the answer from the context, say "I don't know".
 
@@ -56,9 +82,83 @@ If you don't know the answer from the context, say "I don't know".
 Question: {input}
 """)
 
-document_chain = create_stuff_documents_chain(llm, prompt)
-retriever = vector_db.as_retriever(search_kwargs={"k": 6})
-qa_chain = create_retrieval_chain(retriever, document_chain)
+    document_chain = create_stuff_documents_chain(llm, prompt)
+    # Merges overlapping hits, drops near-duplicates and, if CONTEXT_TOKEN_BUDGET is set, caps the context
+    retrieve_context = (lambda inputs: inputs["input"]) | retriever | RunnableLambda(assemble_and_report)
+    qa_chain = create_retrieval_chain(retrieve_context, document_chain)
+
+    answer_cache = AnswerCache(embed_query=embeddings.embed_query)
+    return Pipeline(embeddings, retriever, qa_chain, answer_cache)
+
+
+async def warm_up(built):
+    """One embedding, retrieval and generation, so the first user doesn't pay for loading llama3."""
+    stages = {}
+    for stage, step in (
+        ("embed", lambda: asyncio.to_thread(built.embeddings.embed_query, WARMUP_QUESTION)),
+        ("retrieve", lambda: built.retriever.ainvoke(WARMUP_QUESTION)),
+        ("generate", lambda: built.qa_chain.ainvoke({"input": WARMUP_QUESTION})),
+    ):
+        start = time.perf_counter()
+        await step()
+        stages[stage] = round((time.perf_counter() - start) * 1000, 1)
+    return stages
+
+
+# Set by start_up(); requests get a 503 until then
+pipeline = None
+readiness = {"status": "starting"}
+process_started = time.perf_counter()
+
+
+async def start_up():
+    global pipeline
+    try:
+        built = await asyncio.to_thread(build_pipeline)
+    except Exception as e:
+        print(f" Error: startup failed: {e}")
+        readiness.update(status="failed", error=str(e))
+        return
+
+    if WARMUP:
+        try:
+            readiness["warmup_ms"] = await warm_up(built)
+            print(f" Warmup done: {readiness['warmup_ms']}")
+        except Exception as e:
+            # Still serve: the backend may come up later, the first request just pays for it
+            print(f" Warmup failed: {e}")
+            readiness["warmup_error"] = str(e)
+
+    pipeline = built
+    readiness.update(status="ready", ready_after_s=round(time.perf_counter() - process_started, 2))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Initialise in the background so /healthz answers while the database loads and the model warms up
+    startup = asyncio.create_task(start_up())
+    yield
+    startup.cancel()
+
+
+app = FastAPI(title="Norwegian Immigration RAG API (Hybrid)", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Off unless PROFILE_SAMPLE_RATE or PROFILE_TOKEN is set; see profiling.py
+profiler = RequestProfiler()
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Caps concurrent generations on Ollama (LLM_MAX_CONCURRENCY) and how many may wait (LLM_MAX_QUEUE)
+llm_limiter = AdmissionLimiter()
+# Identical questions arriving together share one retrieval + generation
+flights = SingleFlight()
 
 
 class Message(BaseModel):
@@ -68,6 +168,9 @@ class Message(BaseModel):
 class ChatCompletionRequest(BaseModel):
     model: Optional[str] = "llama3" 
     messages: List[Message]
+    stream: Optional[bool] = False
+    # Non-standard: adds per-stage timings to the response
+    debug: Optional[bool] = False
 
 class Choice(BaseModel):
     index: int
@@ -79,6 +182,7 @@ class ChatCompletionResponse(BaseModel):
     object: str = "chat.completion"
     created: int
     choices: List[Choice]
+    debug: Optional[dict] = None
 
 
 @app.get("/v1/models")
@@ -92,19 +196,144 @@ def list_models():
         }]
     }
 
-@app.post("/v1/chat/completions", response_model=ChatCompletionResponse)
-def chat_completions(request: ChatCompletionRequest):
+ERROR_ANSWER = "I encountered an error connecting to Llama ?"
+
+
+def sse_chunk(completion_id, created, model, delta, finish_reason=None, **extra):
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        **extra,
+    }
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def generate(user_message, model, index_version, slot, timings):
+    from stage_timing import StageTimer
+
+    # Runs in the flight's own task, so embed/retrieve/generate stages land in `timings`
+    current_timings.set(timings)
+    # create_retrieval_chain streams {"input"}, {"context"}, then the answer token by token
+    parts = []
+    try:
+        async for chunk in pipeline.qa_chain.astream({"input": user_message}, config={"callbacks": [StageTimer()]}):
+            token = chunk.get("answer")
+            if token:
+                parts.append(token)
+                yield token
+        await asyncio.to_thread(pipeline.answer_cache.put, user_message, model, index_version, "".join(parts))
+    finally:
+        slot.release()
+
+
+def debug_info(started, cached, flight, coalesced):
+    info = {"answer_cache": "hit" if cached else "miss", "coalesced": coalesced}
+    if flight:
+        info.update(flight.timings.as_dict())
+    info["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return info
+
+
+async def stream_answer(model, cached_answer, flight, started, debug, coalesced):
+    created = int(time.time())
+    completion_id = f"chatcmpl-{created}"
+
+    yield sse_chunk(completion_id, created, model, {"role": "assistant"})
+
+    if cached_answer is not None:
+        yield sse_chunk(completion_id, created, model, {"content": cached_answer})
+    else:
+        try:
+            async for token in flight.subscribe():
+                yield sse_chunk(completion_id, created, model, {"content": token})
+        except Exception as e:
+            print(f" Error: {e}")
+            metrics.ERRORS.inc(stage="request")
+            yield sse_chunk(completion_id, created, model, {"content": ERROR_ANSWER})
+
+    record_stage("total", time.perf_counter() - started)
+    extra = {"debug": debug_info(started, cached_answer is not None, flight, coalesced)} if debug else {}
+    yield sse_chunk(completion_id, created, model, {}, finish_reason="stop", **extra)
+    yield "data: [DONE]\n\n"
+
+
+def queue_headers(slot):
+    return {
+        "X-Queue-Depth": str(slot.queue_depth),
+        "X-Queue-Wait-Ms": f"{slot.wait * 1000:.0f}",
+    }
+
+
+async def join_or_start_flight(user_message, model, index_version):
+    """Returns (flight, headers). Raises HTTPException(429) when a new generation can't be queued."""
+    key = (normalise_question(user_message), model, index_version)
+    flight = flights.get(key)
+    if flight:
+        return flight, {"X-Coalesced": "1"}
+
+    try:
+        slot = await llm_limiter.acquire()
+    except QueueFull as e:
+        metrics.REQUESTS.inc(outcome="rejected")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    # Someone may have started the same question while we were queued
+    flight = flights.get(key)
+    if flight:
+        slot.release()
+        return flight, {"X-Coalesced": "1"}
+
+    timings = RequestTimings()
+    timings.set("queue_wait_ms", round(slot.wait * 1000, 1))
+    flight = flights.start(key, generate(user_message, model, index_version, slot, timings))
+    flight.timings = timings
+    return flight, queue_headers(slot)
+
+
+@app.post("/v1/chat/completions", response_model=ChatCompletionResponse, response_model_exclude_none=True)
+async def chat_completions(request: ChatCompletionRequest, response: Response, http_request: Request):
+    started = time.perf_counter()
+    if pipeline is None:
+        raise HTTPException(status_code=503, detail=f"Service is {readiness['status']}", headers={"Retry-After": "5"})
     user_message = request.messages[-1].content
     print(f" Hybrid Bot received: {user_message}")
 
-    try:
-        
-        result = qa_chain.invoke({"input": user_message})
-        answer_text = result['answer']
-    except Exception as e:
-        print(f" Error: {e}")
-        answer_text = "I encountered an error connecting to Llama ?"
+    index_version = read_index_version(DB_PATH)
+    answer_text = await asyncio.to_thread(pipeline.answer_cache.get, user_message, request.model, index_version)
+
+    flight, headers = None, {}
+    if answer_text is not None:
+        print(" Answer cache hit")
+    else:
+        flight, headers = await join_or_start_flight(user_message, request.model, index_version)
 
+    if flight:
+        # Stage timings for the profile of this request, if it is being profiled
+        http_request.state.timings = flight.timings
+    coalesced = headers.get("X-Coalesced") == "1"
+    outcome = "cache_hit" if flight is None else "coalesced" if coalesced else "generated"
+    metrics.REQUESTS.inc(outcome=outcome)
+
+    if request.stream:
+        return StreamingResponse(
+            stream_answer(request.model, answer_text, flight, started, request.debug, coalesced),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+
+    response.headers.update(headers)
+    if flight:
+        try:
+            answer_text = await flight.result()
+        except Exception as e:
+            print(f" Error: {e}")
+            metrics.ERRORS.inc(stage="request")
+            answer_text = ERROR_ANSWER
+
+    record_stage("total", time.perf_counter() - started)
     return ChatCompletionResponse(
         id=f"chatcmpl-{int(time.time())}",
         created=int(time.time()),
@@ -114,5 +343,52 @@ def chat_completions(request: ChatCompletionRequest):
                 message=Message(role="assistant", content=answer_text),
                 finish_reason="stop"
             )
-        ]
-    )
\ No newline at end of file
+        ],
+        debug=debug_info(started, flight is None, flight, coalesced) if request.debug else None,
+    )
+
+
+@app.get("/healthz")
+def healthz():
+    # Liveness: the process is up and serving, even while the pipeline is still loading
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    # Readiness: route traffic here only once the pipeline is built and warmed up
+    return JSONResponse(readiness, status_code=200 if pipeline is not None else 503)
+
+
+def check_profile_token(token):
+    if not profiler.token:
+        raise HTTPException(status_code=404, detail="Profiling on demand is disabled (set PROFILE_TOKEN)")
+    if not profiler.authorised(token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+@app.get("/admin/profile")
+def profile_status(x_profile_token: Optional[str] = Header(None)):
+    check_profile_token(x_profile_token)
+    return profiler.stats()
+
+
+@app.post("/admin/profile")
+def arm_profiler(requests: int = 1, x_profile_token: Optional[str] = Header(None)):
+    # Profiles the next `requests` chat requests, whoever sends them
+    check_profile_token(x_profile_token)
+    profiler.arm(requests)
+    return profiler.stats()
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # Cache counters live on the cache objects; mirror them at scrape time
+    if pipeline is not None:
+        for result, value in pipeline.embeddings.stats().items():
+            if result != "hit_rate":
+                metrics.CACHE_EVENTS.set(value, cache="embedding", result=result)
+        for result, value in pipeline.answer_cache.stats().items():
+            if result != "entries":
+                metrics.CACHE_EVENTS.set(value, cache="answer", result=result)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,142 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+CHAR_BUCKETS = (500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000)
+
+
+def percentile(values, q):
+    """Nearest-rank q-th percentile (0-100) of `values`; NaN when there are none."""
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        # For totals that are counted elsewhere (e.g. the embedding cache) and mirrored at scrape time
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{format_labels(key)} {series['count']}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Latency per request stage (embed, retrieve, generate, total).", LATENCY_BUCKETS)
+TOKENS = Histogram("rag_tokens", "Prompt and completion tokens per generation.", TOKEN_BUCKETS)
+CONTEXT_CHARS = Histogram("rag_context_chars", "Characters of assembled context stuffed into the prompt.", CHAR_BUCKETS)
+CONTEXT_TOKENS = Histogram("rag_context_tokens", "Estimated context tokens before (retrieved) and after (assembled) assembly.", TOKEN_BUCKETS)
+CACHE_EVENTS = Counter("rag_cache_events_total", "Cache lookups by cache and result.")
+ERRORS = Counter("rag_errors_total", "Failed or rejected requests by stage.")
+REQUESTS = Counter("rag_requests_total", "Chat completion requests by outcome.")
+
+REGISTRY = [STAGE_SECONDS, TOKENS, CONTEXT_CHARS, CONTEXT_TOKENS, CACHE_EVENTS, ERRORS, REQUESTS]
+
+
+def render():
+    """Prometheus text exposition of every metric in this process (one uvicorn worker)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTimings:
+    """Stage timings and sizes for one generation, reported in the debug response field."""
+
+    def __init__(self):
+        self.stages = {}
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def set(self, name, value):
+        with self.lock:
+            self.values[name] = value
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()},
+                **self.values,
+            }
+
+
+# The timings of the generation currently running in this task/thread (copied into executors)
+current_timings = ContextVar("current_timings", default=None)
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import hmac
+import cProfile
+
+# Fraction of chat requests to profile; 0 leaves only the on-demand triggers below
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Needed for on-demand profiles (X-Profile header, POST /admin/profile); empty disables both
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+# "speedscope" (open in https://www.speedscope.app) or "pstats" (python -m pstats, snakeviz)
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "speedscope")
+# Seconds between samples
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+PROFILED_PATHS = ("/v1/chat/completions",)
+
+
+def start_sampler(interval):
+    """A started profiler for the current thread; pyinstrument if installed, else cProfile."""
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    # async_mode="disabled": sample the event loop thread as is, including the flight
+    # task that runs the chain, rather than following only the handler's own task
+    profiler = Profiler(interval=interval, async_mode="disabled")
+    profiler.start()
+    return profiler
+
+
+def stop_sampler(profiler):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+
+def write_profile(profiler, path_base, fmt, meta):
+    """Write the stopped `profiler` to <path_base>.<ext>, and the request's tags to <path_base>.json."""
+    os.makedirs(os.path.dirname(path_base) or ".", exist_ok=True)
+
+    if isinstance(profiler, cProfile.Profile):
+        # cProfile fallback: pstats is the only format it writes
+        profiler.create_stats()
+        path = f"{path_base}.pstats"
+        profiler.dump_stats(path)
+    else:
+        from pyinstrument.renderers import PstatsRenderer, SpeedscopeRenderer
+
+        renderer = PstatsRenderer() if fmt == "pstats" else SpeedscopeRenderer()
+        output = profiler.output(renderer)
+        if fmt != "pstats":
+            # Speedscope shows the profile name in its title bar: the request id and stage timings
+            document = json.loads(output)
+            document["name"] = f"{meta['request_id']} " + " ".join(
+                f"{stage}={ms:.0f}ms" for stage, ms in meta["stages_ms"].items())
+            output = json.dumps(document)
+        path = f"{path_base}.{'pstats' if fmt == 'pstats' else 'speedscope.json'}"
+        with open(path, "w", encoding="utf-8", errors="surrogateescape", newline="") as f:
+            f.write(output)
+
+    meta["profile"] = os.path.basename(path)
+    with open(f"{path_base}.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return path
+
+
+class RequestProfiler:
+    """Decides which requests get profiled and writes one profile per profiled request.
+
+    A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>`, when
+    POST /admin/profile armed the next N requests, or with probability
+    `sample_rate`. Samples come from the event loop thread for the lifetime of
+    the request, so concurrent requests' loop work shows up too, and work sent
+    to threads (embedding calls, cache lookups) appears as time waiting on it.
+    Only one profile runs at a time; requests sampled meanwhile are skipped.
+    """
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, token=PROFILE_TOKEN, directory=PROFILE_DIR,
+                 fmt=PROFILE_FORMAT, interval=PROFILE_INTERVAL):
+        self.sample_rate = sample_rate
+        self.token = token
+        self.directory = directory
+        self.fmt = fmt
+        self.interval = interval
+        self.armed = 0
+        self.busy = False
+        # Profiles stopped but not yet on disk (written after the response has gone out)
+        self.writing = 0
+        self.written = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def authorised(self, token):
+        return bool(self.token) and bool(token) and hmac.compare_digest(token, self.token)
+
+    def arm(self, requests):
+        self.armed = max(0, requests)
+
+    def wanted(self, header, peek=False):
+        # With `peek`, an armed request is not used up (nothing can be profiled right now)
+        if header is not None:
+            return self.authorised(header)
+        if self.armed:
+            if not peek:
+                self.armed -= 1
+            return True
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+    def stats(self):
+        return {"sample_rate": self.sample_rate, "armed": self.armed, "writing": self.writing, "written": self.written,
+                "skipped": self.skipped, "errors": self.errors, "directory": self.directory, "format": self.fmt}
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling selected requests end to end, response body and serialisation included.
+
+    The endpoint can put the request's RequestTimings on `request.state.timings`;
+    its stages end up in the profile's name and in the sidecar JSON. Profiled
+    responses carry an X-Request-ID header naming the files.
+    """
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        # Nothing configured: no header scan, no random draw
+        if not (profiler.sample_rate or profiler.token) or scope["type"] != "http" or scope["path"] not in PROFILED_PATHS:
+            return await self.app(scope, receive, send)
+
+        header, request_id = None, None
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                header = value.decode("latin-1")
+            elif name == b"x-request-id":
+                request_id = value.decode("latin-1")
+
+        # Checked first so a request armed via /admin/profile waits for a free profiler
+        if profiler.busy:
+            if profiler.wanted(header, peek=True):
+                profiler.skipped += 1
+            return await self.app(scope, receive, send)
+        if not profiler.wanted(header):
+            return await self.app(scope, receive, send)
+
+        # Only characters that are safe in a file name
+        request_id = "".join(c for c in (request_id or uuid.uuid4().hex) if c.isalnum() or c in "-_")[:64]
+        request_id = request_id or uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        state = scope.setdefault("state", {})
+        profiler.busy = True
+        started = time.perf_counter()
+        sampler = start_sampler(profiler.interval)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            stop_sampler(sampler)
+            total_ms = round((time.perf_counter() - started) * 1000, 1)
+            profiler.busy = False
+            profiler.writing += 1
+
+            timings = state.get("timings")
+            details = timings.as_dict() if timings else {}
+            meta = {
+                "request_id": request_id,
+                "path": scope["path"],
+                "created": int(time.time()),
+                "stages_ms": {**details.pop("stages_ms", {}), "request": total_ms},
+                **details,
+            }
+            path_base = os.path.join(profiler.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id}")
+            try:
+                # Rendering walks every sample; keep it off the event loop
+                path = await asyncio.to_thread(write_profile, sampler, path_base, profiler.fmt, meta)
+                profiler.written += 1
+                print(f" Profile written: {path}")
+            except Exception as e:
+                profiler.errors += 1
+                print(f" Error: could not write profile for {request_id}: {e}")
+            finally:
+                profiler.writing -= 1
@@ -0,0 +1,42 @@
+import os
+
+DB_PATH = "chroma_db"
+# "chroma" or "flat" (memory-mapped matrix written by 3_ingest.py, shared by all workers)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# "vector" or "hybrid" (BM25 + vector fused with RRF, keyword queries matched verbatim in k chunks skip the embedding call)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "6"))
+# Candidates each ranking contributes to the fusion in hybrid mode
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+
+FLAT_INDEX_DIR = "flat_index"
+LEXICAL_INDEX_DIR = "lexical_index"
+
+
+def build_retriever(embeddings, k=RETRIEVAL_K, db_path=DB_PATH, vector_backend=VECTOR_BACKEND,
+                    retrieval_mode=RETRIEVAL_MODE, fetch_k=HYBRID_FETCH_K):
+    """The retriever main_api.py serves; 5_run_benchmark.py evaluates the same one.
+
+    Chroma and LangChain are imported here rather than at the top, so
+    importing this module stays cheap.
+    """
+    vector_k = max(k, fetch_k) if retrieval_mode == "hybrid" else k
+    if vector_backend == "flat":
+        from vector_index import FlatIndex, FlatIndexRetriever
+
+        retriever = FlatIndexRetriever(index=FlatIndex(os.path.join(db_path, FLAT_INDEX_DIR)), embeddings=embeddings,
+                                       k=vector_k)
+    else:
+        from langchain_community.vectorstores import Chroma
+
+        vector_db = Chroma(persist_directory=db_path, embedding_function=embeddings)
+        retriever = vector_db.as_retriever(search_kwargs={"k": vector_k})
+
+    if retrieval_mode == "hybrid":
+        from lexical_index import HybridRetriever, LexicalIndex
+
+        retriever = HybridRetriever(
+            lexical=LexicalIndex(os.path.join(db_path, LEXICAL_INDEX_DIR)), vector_retriever=retriever, k=k,
+            fetch_k=vector_k,
+        )
+    return retriever
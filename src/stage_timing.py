@@ -0,0 +1,79 @@
+import time
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.embeddings import Embeddings
+
+from metrics import ERRORS, TOKENS, current_timings, record_stage, timed
+
+
+class TimedEmbeddings(Embeddings):
+    """Times every embedding call as the "embed" stage (embeddings emit no LangChain callbacks)."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        with timed("embed"):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        with timed("embed"):
+            return self.embeddings.embed_query(text)
+
+    def stats(self):
+        return self.embeddings.stats()
+
+
+class StageTimer(AsyncCallbackHandler):
+    """Callback handler that turns retriever and LLM runs into "retrieve"/"generate" stage timings."""
+
+    def __init__(self):
+        self.started = {}
+        self.retrievers = set()
+        self.first_token = None
+
+    async def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+        self.retrievers.add(run_id)
+
+    async def on_retriever_end(self, documents, *, run_id, parent_run_id=None, **kwargs):
+        elapsed = time.perf_counter() - self.started.pop(run_id, time.perf_counter())
+        if parent_run_id in self.retrievers:
+            # The vector half of a hybrid retriever; its parent reports "retrieve"
+            record_stage("retrieve_vector", elapsed)
+            return
+        self.retrievers.clear()
+        record_stage("retrieve", elapsed)
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.started[run_id] = time.perf_counter()
+
+    async def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if self.first_token is None and run_id in self.started:
+            self.first_token = time.perf_counter() - self.started[run_id]
+            record_stage("first_token", self.first_token)
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        record_stage("generate", time.perf_counter() - self.started.pop(run_id, time.perf_counter()))
+        info = {}
+        for generations in response.generations:
+            for generation in generations:
+                info.update(generation.generation_info or {})
+
+        timings = current_timings.get()
+        for key, kind in (("prompt_eval_count", "prompt"), ("eval_count", "completion")):
+            if key in info:
+                TOKENS.observe(info[key], kind=kind)
+                if timings is not None:
+                    timings.set(f"{kind}_tokens", info[key])
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+        ERRORS.inc(stage="generate")
+
+    async def on_retriever_error(self, error, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+        ERRORS.inc(stage="retrieve")